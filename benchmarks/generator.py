@@ -0,0 +1,64 @@
+'''
+Seeded generator of synthetic fact tables for benchmarks.
+'''
+from datetime import date, timedelta
+import numpy as np
+import sqlalchemy
+
+
+BATCH_SIZE = 10000
+
+
+def generate(path, n_rows=100000, row_cardinality=100, col_cardinality=10,
+             n_values=1, decimal=False, datetime_axis=False, seed=0):
+    '''
+    Create SQLite database at path with table facts(row_key, col_key,
+    value_0, ..., value_n).
+
+    :param path: SQLite database file
+    :param n_rows: number of facts
+    :param row_cardinality: number of distinct row_key values
+    :param col_cardinality: number of distinct col_key values
+    :param n_values: number of value columns
+    :param decimal: value columns are Numeric (Decimal) instead of Float
+    :param datetime_axis: row_key is a Date instead of a String
+    :param seed: random seed
+    :return: facts table bound to the database engine
+    '''
+    engine = sqlalchemy.create_engine('sqlite:///%s' % path)
+    metadata = sqlalchemy.MetaData(bind=engine)
+
+    value_type = sqlalchemy.Numeric(12, 2) if decimal else sqlalchemy.Float
+    row_type = sqlalchemy.Date if datetime_axis else sqlalchemy.String(20)
+    facts = sqlalchemy.Table(
+        'facts', metadata,
+        sqlalchemy.Column('row_key', row_type),
+        sqlalchemy.Column('col_key', sqlalchemy.String(20)),
+        *[sqlalchemy.Column('value_%d' % i, value_type)
+          for i in range(n_values)]
+    )
+    metadata.drop_all()
+    metadata.create_all()
+
+    if datetime_axis:
+        start = date(2000, 1, 1)
+        row_keys = [start + timedelta(days=i) for i in range(row_cardinality)]
+    else:
+        row_keys = ['row%d' % i for i in range(row_cardinality)]
+    col_keys = ['col%d' % i for i in range(col_cardinality)]
+
+    random = np.random.RandomState(seed)
+    for start in range(0, n_rows, BATCH_SIZE):
+        size = min(BATCH_SIZE, n_rows - start)
+        rows = random.randint(0, row_cardinality, size)
+        cols = random.randint(0, col_cardinality, size)
+        values = np.round(random.rand(n_values, size) * 100, 2)
+
+        facts.insert().execute([
+            dict([('row_key', row_keys[rows[i]]),
+                  ('col_key', col_keys[cols[i]])] +
+                 [('value_%d' % j, float(values[j, i]))
+                  for j in range(n_values)])
+            for i in range(size)])
+
+    return facts
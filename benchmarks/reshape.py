@@ -0,0 +1,57 @@
+'''
+Benchmark of reshaping grouped data into pivot table, compares
+DataFrame.pivot_table with the unstack used by pivot_table_from_select.
+
+    python -m benchmarks.reshape
+'''
+import timeit
+import numpy as np
+import pandas as pd
+from pivots.table import _pivot_frame, _unstack
+
+
+SIZES = [
+    (1000, 10),
+    (10000, 100),
+    (10000, 1000),
+    (100000, 100),
+]
+
+
+def grouped_frame(n_rows, n_cols, density=0.5, seed=0):
+    '''
+    Get frame with unique (row, col) keys like pivot_data returns, about
+    density of all n_rows * n_cols keys is present.
+    '''
+    random = np.random.RandomState(seed)
+    cells = np.flatnonzero(random.rand(n_rows * n_cols) < density)
+
+    return pd.DataFrame({
+        'row': np.array(['row%d' % i for i in range(n_rows)],
+                        dtype=object)[cells // n_cols],
+        'col': np.array(['col%d' % i for i in range(n_cols)],
+                        dtype=object)[cells % n_cols],
+        'value': random.rand(len(cells)),
+    }, columns=['row', 'col', 'value'])
+
+
+def main(repeat=3):
+    print('%8s %6s %10s %14s %10s %8s' % ('rows', 'cols', 'cells',
+                                          'pivot_table', 'unstack', 'ratio'))
+    for n_rows, n_cols in SIZES:
+        df = grouped_frame(n_rows, n_cols)
+
+        pivot_table = min(timeit.repeat(
+            lambda: _pivot_frame(df, 'row', 'col', ['value'], 'mean'),
+            number=1, repeat=repeat))
+        unstack = min(timeit.repeat(
+            lambda: _unstack(df, 'row', 'col', ['value']),
+            number=1, repeat=repeat))
+
+        print('%8d %6d %10d %13.3fs %9.3fs %8.1f' % (
+            n_rows, n_cols, len(df), pivot_table, unstack,
+            pivot_table / unstack))
+
+
+if __name__ == '__main__':
+    main()
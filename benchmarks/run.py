@@ -0,0 +1,163 @@
+'''
+Benchmark of pivot stages on a synthetic SQLite database.
+
+    python -m benchmarks.run --rows 1000000 --row-cardinality 1000
+    python -m benchmarks.run --json new.json --compare old.json
+
+Every stage of pivot_table_from_select and get_chart is measured
+separately: SQL execution, fetch, conversion into DataFrame, reshape and
+chart serialization, followed by the whole pivot_table_from_select and
+its columnar variant. Peak memory is the peak of memory allocated during
+the stage traced by tracemalloc, which slows allocations down. Python 2
+reports the growth of the resident set size of the process during the
+stage on Linux instead. With --no-memory memory is not measured.
+'''
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import timeit
+from functools import partial
+from pivots import get_chart, pivot_table_from_select
+from pivots.table import _aggr_column_names, _column_names, _data_frame, \
+    _pivot_select, _unstack
+from benchmarks.generator import generate
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+STATM = '/proc/self/statm'
+
+
+class Measure(object):
+    def __init__(self, results, name, memory=True):
+        self.results = results
+        self.name = name
+        self.memory = memory
+
+    def __enter__(self):
+        if self.memory and tracemalloc is not None:
+            tracemalloc.start()
+        elif self.memory:
+            self.rss = _rss()
+        self.start = timeit.default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = timeit.default_timer() - self.start
+        peak_memory = None
+        if self.memory and tracemalloc is not None:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        elif self.memory and self.rss is not None:
+            peak_memory = max(_rss() - self.rss, 0)
+        self.results.append({'stage': self.name, 'time': duration,
+                             'peak_memory': peak_memory})
+
+
+def run_stages(facts, rows='row_key', cols='col_key', values=None,
+               memory=True):
+    '''
+    :param memory: measure memory of stages
+    :return: list of dicts with stage, time and peak_memory
+    '''
+    values = values or [c.name for c in facts.c if c.name.startswith('value')]
+    select = facts.select()
+    names = _aggr_column_names(values)
+    results = []
+    measure = partial(Measure, results, memory=memory)
+
+    pivot_select = _pivot_select(select, rows, cols, values)
+    with measure('execute'):
+        result = select.bind.execute(pivot_select)
+    with measure('fetch'):
+        data = list(map(tuple, result.fetchall()))
+    with measure('convert'):
+        df = _data_frame(data, _column_names(rows, cols, names))
+    with measure('reshape'):
+        pivot = _unstack(df, rows, cols, names)
+    with measure('chart'):
+        get_chart(pivot, rows, cols, names, {})
+
+    with measure('pivot_table_from_select'):
+        pivot_table_from_select(select, rows, cols, values)
+    with measure('pivot_table_from_select columnar'):
+        pivot_table_from_select(select, rows, cols, values, columnar=True)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--row-cardinality', type=int, default=100)
+    parser.add_argument('--col-cardinality', type=int, default=10)
+    parser.add_argument('--values', type=int, default=1)
+    parser.add_argument('--decimal', action='store_true')
+    parser.add_argument('--datetime', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true',
+                        help='measure time only')
+    parser.add_argument('--json', help='write results to the file')
+    parser.add_argument('--compare', help='compare with results in the file')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        facts = generate(os.path.join(directory, 'facts.db'),
+                         n_rows=args.rows,
+                         row_cardinality=args.row_cardinality,
+                         col_cardinality=args.col_cardinality,
+                         n_values=args.values, decimal=args.decimal,
+                         datetime_axis=args.datetime, seed=args.seed)
+        results = run_stages(facts, memory=not args.no_memory)
+        facts.bind.dispose()
+    finally:
+        shutil.rmtree(directory)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = dict((r['stage'], r) for r in json.load(f))
+
+    print('%-34s %10s %12s %10s' % ('stage', 'time', 'peak memory',
+                                    'vs base'))
+    for result in results:
+        base = baseline.get(result['stage'])
+        print('%-34s %9.3fs %12s %10s' % (
+            result['stage'], result['time'],
+            _format_bytes(result['peak_memory']),
+            '%.2fx' % (result['time'] / base['time']) if base else ''))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+def _rss():
+    '''
+    Get resident set size of the process in bytes, None where /proc is
+    missing.
+    '''
+    try:
+        with open(STATM) as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError):
+        return None
+
+
+def _format_bytes(n):
+    if n is None:
+        return '-'
+    for unit in ['B', 'KB', 'MB']:
+        if n < 1024:
+            return '%.1f%s' % (n, unit)
+        n /= 1024.0
+    return '%.1fGB' % n
+
+
+if __name__ == '__main__':
+    main()
@@ -1,2 +1,10 @@
-from pivots.table import pivot_data, pivot_table, pivot_table_from_select
-from pivots.highcharts import get_chart
+from pivots.table import pivot_data, pivot_data_chunks, pivot_data_frame, \
+    pivot_table, pivot_table_from_select, pivot_table_streamed, \
+    pivot_col_keys, pivot_table_sql, pivot_many, pivot_data_partitioned, \
+    pivot_table_margins, pivot_table_sampled
+from pivots.highcharts import get_chart, iter_chart_json, write_chart
+from pivots.cache import MemoryCache, DiskCache
+from pivots.buckets import TimeBucket
+from pivots.query import PivotQuery
+from pivots.materialized import MaterializedPivot
+from pivots.store import SharedStore
@@ -0,0 +1,164 @@
+'''
+Registry of aggregate tables.
+
+Aggregate tables hold partial aggregates of a select grouped by some of
+its columns. They are registered for the select they were aggregated
+from, selects reading the same columns of the same tables with the same
+conditions share them:
+
+    pivots.aggregates.register(
+        select, sales_by_month.select(),
+        dimensions=['yearmonth', 'town', 'gender'],
+        measures={('sum', 'price'): 'price_sum',
+                  ('count', 'price'): 'price_count'})
+
+When the rows, cols and values of a pivot of the select are covered by an
+aggregate table, the pivot select reads from the smallest such table
+instead of the select. Dimensions must have the same names in both
+selects, measures map sum, count, min and max of select columns to
+columns of the aggregate table. Values can be sum, count, min, max and avg
+computed from sum and count.
+
+Aggregate tables hold data of the values of parameters of the select,
+selects with parameters without value cannot be registered and are not
+routed to aggregate tables.
+'''
+import sqlalchemy
+from pivots.cache import statement_key
+
+
+PARTIALS = {
+    'sum': ('sum',),
+    'count': ('count',),
+    len: ('count',),
+    'min': ('min',),
+    'max': ('max',),
+    'avg': ('sum', 'count'),
+    'mean': ('sum', 'count'),
+}
+
+MERGE = {
+    'sum': 'sum',
+    'count': 'sum',
+    'min': 'min',
+    'max': 'max',
+}
+
+_aggregates = {}
+_version = [0]
+
+
+class Aggregate(object):
+    '''
+    Aggregate table of a select.
+
+    :param select: select of the aggregate table
+    :param dimensions: names of group columns
+    :param measures: dictionary (function, select column) -> aggregate
+        table column
+    :param size: number of rows
+    '''
+
+    def __init__(self, select, dimensions, measures, size):
+        self.select = select
+        self.dimensions = frozenset(dimensions)
+        self.measures = dict(measures)
+        self.size = size
+
+    def covers(self, keys, values):
+        '''
+        :param keys: rows and cols
+        :param values: list of (column, function) tuples
+        '''
+        if not set(keys) <= self.dimensions:
+            return False
+
+        for name, func_name in values:
+            partials = PARTIALS.get(func_name)
+            if partials is None or any((partial, name) not in self.measures
+                                       for partial in partials):
+                return False
+        return True
+
+
+def register(base, select, dimensions, measures, size=None):
+    '''
+    Register aggregate table of the base select.
+
+    :param base: select the table was aggregated from
+    :param size: number of rows, counted when None
+    :return: Aggregate
+    '''
+    key = _key(base)
+    if key is None:
+        raise ValueError('Aggregate tables of selects with unbound '
+                         'parameters cannot be registered')
+
+    if size is None:
+        count = sqlalchemy.select([sqlalchemy.func.count()]).select_from(
+            select.alias('pivot_aggregate'))
+        size = count.execute(bind=select.bind).scalar()
+
+    aggregate = Aggregate(select, dimensions, measures, size)
+    _aggregates.setdefault(key, []).append(aggregate)
+    _version[0] += 1
+    return aggregate
+
+
+def unregister(base, select=None):
+    '''
+    Unregister aggregate table of the base select, all of its tables when
+    select is None.
+    '''
+    key = _key(base)
+    if key is None:
+        return
+
+    aggregates = _aggregates.pop(key, [])
+    if select is not None:
+        aggregates = [a for a in aggregates if a.select is not select]
+        if aggregates:
+            _aggregates[key] = aggregates
+    _version[0] += 1
+
+
+def find(base, keys, values):
+    '''
+    Get the smallest aggregate table of the base select covering keys and
+    values, see Aggregate.covers.
+
+    :return: Aggregate or None
+    '''
+    if not _aggregates:
+        return None
+
+    key = _key(base)
+    if key is None:
+        return None
+
+    aggregates = [aggregate for aggregate in _aggregates.get(key, ())
+                  if aggregate.covers(keys, values)]
+    if aggregates:
+        return min(aggregates, key=lambda aggregate: aggregate.size)
+    return None
+
+
+def version():
+    '''
+    Get number changed by every change of the registry.
+    '''
+    return _version[0]
+
+
+def _key(select):
+    '''
+    Get registry key of the select from its database, tables, columns,
+    conditions and parameters, the order does not change the key.
+
+    :return: key or None when a parameter of the select has no value
+    '''
+    statement = select.order_by(None)
+    compiled = statement.compile(bind=select.bind)
+    if any(bind.required for bind in compiled.binds.values()):
+        return None
+    return statement_key(statement, select.bind, compiled=compiled)
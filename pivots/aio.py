@@ -0,0 +1,73 @@
+'''
+Asyncio variants of pivot functions.
+
+The aggregated data are read through SQLAlchemy asyncio extension, bind is
+AsyncEngine or AsyncConnection:
+
+    engine = create_async_engine('postgresql+asyncpg://...')
+    table = await pivots.aio.pivot_table_from_select(
+        engine, select, rows='yearmonth', cols='gender', values='price')
+
+The pandas reshape and chart serialization run in executor, so the event
+loop is not blocked by them.
+
+Requires Python 3.5+ and SQLAlchemy 1.4+, the module is not imported by
+pivots.
+'''
+import asyncio
+from functools import partial
+from pivots import highcharts
+from pivots.table import _pivot_select, _aggr_column_names, _column_names, \
+    _data_frame, _unstack
+
+
+async def pivot_data(bind, select, rows, cols, values):
+    '''
+    Get aggregated data for pivot table, see pivots.pivot_data.
+
+    :param bind: AsyncEngine or AsyncConnection
+    '''
+    pivot_select = _pivot_select(select, rows, cols, values)
+
+    if hasattr(bind, 'execute'):
+        result = await bind.execute(pivot_select)
+        return [tuple(row) for row in result.fetchall()]
+
+    async with bind.connect() as connection:
+        result = await connection.execute(pivot_select)
+        return [tuple(row) for row in result.fetchall()]
+
+
+async def pivot_table_from_select(bind, select, rows, cols, values,
+                                  executor=None):
+    '''
+    Get pivot table for the select, see pivots.pivot_table_from_select.
+
+    :param bind: AsyncEngine or AsyncConnection
+    :param executor: executor for the reshape, default executor of the loop
+        when None
+    :return: pivot table or None for empty result
+    '''
+    data = await pivot_data(bind, select, rows, cols, values)
+    if data:
+        values = _aggr_column_names(values)
+        return await _run(executor, _pivot_table, data, rows, cols, values)
+
+
+async def get_chart(pivot, rows, cols, values, charts, executor=None):
+    '''
+    Get dictionary from pivot suitable for Highcharts.com, see
+    pivots.get_chart.
+    '''
+    return await _run(executor, highcharts.get_chart, pivot, rows, cols,
+                      values, charts)
+
+
+def _pivot_table(data, rows, cols, values):
+    df = _data_frame(data, _column_names(rows, cols, values))
+    return _unstack(df, rows, cols, values)
+
+
+def _run(executor, func, *args):
+    loop = asyncio.get_event_loop()
+    return loop.run_in_executor(executor, partial(func, *args))
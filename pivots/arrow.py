@@ -0,0 +1,143 @@
+'''
+Apache Arrow support, requires pyarrow. The module is not imported by
+pivots.
+
+    data = pivots.arrow.pivot_data_arrow(select, rows, cols, values)
+    table = pivots.arrow.pivot_table_from_arrow(data, rows, cols, values)
+    pivots.arrow.write_pivot(table, 'pivot.parquet', format='parquet')
+'''
+import pyarrow as pa
+from pivots.instrument import stage
+from pivots.table import CHUNK_SIZE, _aggr_column_names, _column_names, \
+    _compile_pivot_select, _unstack
+
+
+def pivot_data_arrow(select, rows, cols, values, chunk_size=CHUNK_SIZE):
+    '''
+    Get aggregated data for pivot table as pyarrow.Table.
+
+    When the DBAPI cursor returns Arrow itself (fetch_arrow_table of ADBC
+    and DuckDB drivers), its table is used. Otherwise the rows are fetched
+    in chunks of chunk_size and converted into Arrow arrays per column.
+    Decimal columns are cast to float64 by Arrow.
+
+    Arguments are the same as to pivots.pivot_data.
+
+    :return: pyarrow.Table with rows, cols and values columns
+    '''
+    names = _column_names(rows, cols, _aggr_column_names(values))
+    pivot_select = _compile_pivot_select(select, rows, cols, values)
+
+    with stage('execute'):
+        result = pivot_select.execute(bind=select.bind)
+
+    with stage('fetch') as s:
+        try:
+            cursor = result.cursor
+            if hasattr(cursor, 'fetch_arrow_table'):
+                table = cursor.fetch_arrow_table()
+                table = pa.Table.from_arrays(
+                    [_cast_decimal(column) for column in table.columns],
+                    names=names)
+            else:
+                table = _fetch_table(result, names, chunk_size)
+        finally:
+            result.close()
+
+        if s:
+            s.set(rows=table.num_rows, bytes=table.nbytes)
+
+    return table
+
+
+def pivot_table_from_arrow(data, rows, cols, values):
+    '''
+    Get pivot table from result of pivot_data_arrow.
+
+    :return: pivot table or None for empty data
+    '''
+    if data.num_rows:
+        with stage('convert') as s:
+            df = data.to_pandas()
+            if s:
+                s.set(rows=len(df))
+
+        return _unstack(df, rows, cols, _aggr_column_names(values))
+
+
+def pivot_table_arrow(select, rows, cols, values):
+    '''
+    Get pivot table for the select through Arrow, see pivot_data_arrow.
+    '''
+    data = pivot_data_arrow(select, rows, cols, values)
+    return pivot_table_from_arrow(data, rows, cols, values)
+
+
+def pivot_to_arrow(pivot):
+    '''
+    Convert pivot table to pyarrow.Table, index and columns are kept in
+    its pandas metadata.
+    '''
+    return pa.Table.from_pandas(pivot)
+
+
+def write_pivot(pivot, where, format='ipc'):
+    '''
+    Write pivot table as Arrow IPC file or Parquet.
+
+    :param pivot: pivot table
+    :param where: path or file object
+    :param format: 'ipc' or 'parquet'
+    '''
+    table = pivot_to_arrow(pivot)
+
+    if format == 'parquet':
+        import pyarrow.parquet
+        pyarrow.parquet.write_table(table, where)
+    elif format == 'ipc':
+        with pa.ipc.new_file(where, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        raise ValueError('Unknown format %r' % format)
+
+
+def read_pivot(where, format='ipc'):
+    '''
+    Read pivot table written by write_pivot.
+    '''
+    if format == 'parquet':
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(where)
+    elif format == 'ipc':
+        table = pa.ipc.open_file(where).read_all()
+    else:
+        raise ValueError('Unknown format %r' % format)
+
+    return table.to_pandas()
+
+
+def _fetch_table(result, names, chunk_size):
+    columns = [[] for _ in names]
+    while True:
+        fetched = result.fetchmany(chunk_size)
+        if not fetched:
+            break
+        for chunks, column in zip(columns, zip(*fetched)):
+            chunks.append(_cast_decimal(pa.array(column)))
+
+    return pa.Table.from_arrays([_chunked_array(chunks) for chunks in columns],
+                                names=names)
+
+
+def _chunked_array(chunks):
+    types = [chunk.type for chunk in chunks if chunk.type != pa.null()]
+    if not types:
+        return pa.chunked_array(chunks, type=pa.null())
+
+    return pa.chunked_array([chunk.cast(types[0]) for chunk in chunks])
+
+
+def _cast_decimal(array):
+    if pa.types.is_decimal(array.type):
+        return array.cast(pa.float64())
+    return array
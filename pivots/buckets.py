@@ -0,0 +1,98 @@
+'''
+Time buckets of datetime columns.
+
+TimeBucket can be used in rows and cols instead of a column name, the
+column is truncated to the grain in the database and grouped by it:
+
+    table = pivots.pivot_table_from_select(
+        select, rows=pivots.TimeBucket('created', 'month'), cols='gender',
+        values='price')
+
+The key keeps the column name and the pivot table has DatetimeIndex of
+bucket starts.
+
+Columns are truncated by date_trunc on DATE_TRUNC_DIALECTS, SQLite uses
+its date and time functions. Other databases raise ValueError when the
+statement is compiled. Time buckets are not supported by pivot_many and
+margins, they raise ValueError too.
+'''
+import collections
+import sqlalchemy
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+
+GRAINS = ('year', 'quarter', 'month', 'week', 'day', 'hour', 'minute')
+DATE_TRUNC_DIALECTS = ('postgresql', 'redshift', 'snowflake', 'duckdb')
+
+
+class TimeBucket(collections.namedtuple('TimeBucket', 'column grain')):
+    '''
+    Key of rows or cols truncating datetime column to grain, one of GRAINS.
+    Weeks start on Monday.
+    '''
+
+    def __new__(cls, column, grain):
+        if grain not in GRAINS:
+            raise ValueError('Unknown grain %r' % grain)
+        return super(TimeBucket, cls).__new__(cls, column, grain)
+
+
+def truncate(column, grain):
+    '''
+    Get expression truncating datetime column to grain.
+    '''
+    return _Truncate(column, grain)
+
+
+def key_name(key):
+    '''
+    Get name of column of rows or cols key in the aggregated data.
+    '''
+    return key.column if isinstance(key, TimeBucket) else key
+
+
+class _Truncate(FunctionElement):
+    name = 'date_trunc'
+    type = sqlalchemy.DateTime()
+
+    def __init__(self, column, grain):
+        self.grain = grain
+        super(_Truncate, self).__init__(column)
+
+
+_SQLITE_MODIFIERS = {
+    'year': "'start of year'",
+    'month': "'start of month'",
+    'week': "'start of day', 'weekday 0', '-6 days'",
+    'day': "'start of day'",
+}
+
+_SQLITE_FORMATS = {
+    'hour': '%Y-%m-%d %H:00:00',
+    'minute': '%Y-%m-%d %H:%M:00',
+}
+
+
+@compiles(_Truncate)
+def _compile_truncate(element, compiler, **kw):
+    if compiler.dialect.name not in DATE_TRUNC_DIALECTS:
+        raise ValueError('Time buckets are not supported on %s' %
+                         compiler.dialect.name)
+    return "date_trunc('%s', %s)" % (element.grain,
+                                     compiler.process(element.clauses, **kw))
+
+
+@compiles(_Truncate, 'sqlite')
+def _compile_truncate_sqlite(element, compiler, **kw):
+    column = compiler.process(element.clauses, **kw)
+
+    if element.grain in _SQLITE_FORMATS:
+        return "strftime('%s', %s)" % (_SQLITE_FORMATS[element.grain], column)
+
+    if element.grain == 'quarter':
+        return ("datetime(%s, 'start of month', "
+                "'-' || ((strftime('%%m', %s) - 1) %% 3) || ' months')" % (
+                    column, column))
+
+    return 'datetime(%s, %s)' % (column, _SQLITE_MODIFIERS[element.grain])
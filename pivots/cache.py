@@ -0,0 +1,223 @@
+'''
+Caches for aggregated pivot data.
+
+Cache is passed to pivots.pivot_data or pivots.pivot_table_from_select:
+
+    cache = pivots.MemoryCache(max_size=100, ttl=60)
+    table = pivots.pivot_table_from_select(select, rows, cols, values,
+                                           cache=cache)
+
+Entries are keyed by the compiled pivot select and its bound parameters and
+remember the tables they were read from, so they can be invalidated when
+the tables change:
+
+    cache.invalidate(tables=['mytable'])
+'''
+import collections
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from sqlalchemy.sql.util import find_tables
+
+
+class Cache(object):
+    '''
+    Base class of caches. Subclasses implement _get, _set, _invalidate and
+    __len__.
+    '''
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._counters_lock = threading.Lock()
+
+    def get(self, key):
+        '''
+        :return: cached value or None
+        '''
+        value = self._get(key)
+        self._count('misses' if value is None else 'hits')
+        return value
+
+    def set(self, key, value, tables=()):
+        '''
+        :param key: key from statement_key
+        :param value: cached value
+        :param tables: names of tables the value was read from
+        '''
+        self._set(key, value, frozenset(tables))
+
+    def invalidate(self, tables=None):
+        '''
+        Remove entries read from any of tables, all entries when tables is
+        None.
+        '''
+        self._invalidate(None if tables is None else frozenset(tables))
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self),
+        }
+
+    def _count(self, counter):
+        with self._counters_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+
+class MemoryCache(Cache):
+    '''
+    In-process LRU cache with at most max_size entries, entries older than
+    ttl seconds are evicted.
+    '''
+
+    def __init__(self, max_size=128, ttl=None):
+        super(MemoryCache, self).__init__(ttl)
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+
+            created, tables, value = entry
+            if self._expired(created):
+                self._count('evictions')
+                return None
+
+            self._entries[key] = entry
+            return value
+
+    def _set(self, key, value, tables):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time(), tables, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._count('evictions')
+
+    def _invalidate(self, tables):
+        with self._lock:
+            if tables is None:
+                self._entries.clear()
+                return
+
+            for key, (_, entry_tables, _) in list(self._entries.items()):
+                if entry_tables & tables:
+                    del self._entries[key]
+
+
+class DiskCache(Cache):
+    '''
+    Cache storing pickled entries in a directory, so it can be shared by
+    processes on one host. Entries older than ttl seconds are evicted.
+
+    Counters are kept per process.
+    '''
+
+    suffix = '.pivot'
+
+    def __init__(self, directory, ttl=None):
+        super(DiskCache, self).__init__(ttl)
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def __len__(self):
+        return len(self._paths())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def _paths(self):
+        return [os.path.join(self.directory, name)
+                for name in os.listdir(self.directory)
+                if name.endswith(self.suffix)]
+
+    def _get(self, key):
+        path = self._path(key)
+        try:
+            if self._expired(os.path.getmtime(path)):
+                self._remove(path)
+                self._count('evictions')
+                return None
+
+            with open(path, 'rb') as f:
+                pickle.load(f)
+                return pickle.load(f)
+        except (IOError, OSError, EOFError):
+            return None
+
+    def _set(self, key, value, tables):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(tables, f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_path, self._path(key))
+        finally:
+            self._remove(tmp_path)
+
+    def _invalidate(self, tables):
+        for path in self._paths():
+            if tables is not None:
+                try:
+                    with open(path, 'rb') as f:
+                        if not pickle.load(f) & tables:
+                            continue
+                except (IOError, OSError, EOFError):
+                    continue
+            self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def statement_key(statement, bind=None, params=None, compiled=None):
+    '''
+    Get cache key of the statement from the URL of the database it runs
+    on, its compiled SQL and bound parameters.
+
+    :param params: values of bind parameters overriding the statement ones
+    :param compiled: already compiled statement
+    '''
+    if compiled is None:
+        compiled = statement.compile(bind=bind)
+    params = sorted(compiled.construct_params(params).items())
+    return hashlib.sha1(repr((
+        _bind_url(bind), str(compiled), params)).encode('utf-8')).hexdigest()
+
+
+def statement_tables(statement):
+    '''
+    Get names of tables the statement reads from.
+    '''
+    return set(table.name for table in find_tables(statement))
+
+
+def _bind_url(bind):
+    if bind is None:
+        return None
+    url = getattr(bind, 'url', None)
+    if url is None:
+        url = bind.engine.url
+    return str(url)
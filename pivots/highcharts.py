@@ -1,9 +1,21 @@
 from datetime import date, datetime
+import json
+import numpy as np
 import pandas as pd
+from pivots.instrument import stage
 from pivots.millis import unix_time_millis
 
 
-def get_chart(pivot, rows, cols, values, charts):
+CHUNK_SIZE = 10000
+DAY_NANOS = 86400 * 10 ** 9
+
+try:
+    _string_types = basestring
+except NameError:
+    _string_types = str
+
+
+def get_chart(pivot, rows, cols, values, charts, max_points=None):
     '''
     Get dictionary from pivot suitable for Highcharts.com
      Arguments are the same as to pivots.pivot_table
@@ -11,17 +23,21 @@ def get_chart(pivot, rows, cols, values, charts):
      Charts is a dict value->chart_type, where chart type is one of highcharts
      types.
 
+     Series on datetime axis with more than max_points points are
+     downsampled, see get_series.
+
     :param pivot: dataframe
     :param rows:
     :param cols:
     :param values:
     :param charts:
+    :param max_points: maximal number of points of a serie
     :return: highcharts dictionary
     '''
     xaxis = get_axes(pivot.index, rows, xaxis=True)
     yaxis = get_axes(pivot.columns, values, xaxis=False)
 
-    series = get_series(pivot, yaxis, charts)
+    series = get_series(pivot, yaxis, charts, max_points)
 
     return {
         'xAxis': xaxis,
@@ -30,16 +46,125 @@ def get_chart(pivot, rows, cols, values, charts):
     }
 
 
-def get_series(table, yaxis, charts=None):
+def iter_chart_json(pivot, rows, cols, values, charts,
+                    chunk_size=CHUNK_SIZE, max_points=None):
+    '''
+    Get Highcharts JSON of get_chart incrementally.
+
+    Series are encoded one by one, chunk_size points at once, so the whole
+    chart is never held in memory.
+
+    :return: generator of JSON strings
+    '''
+    with stage('serialize', shape=pivot.shape):
+        xaxis = get_axes(pivot.index, rows, xaxis=True)
+        yaxis = get_axes(pivot.columns, values, xaxis=False)
+
+        yield '{"xAxis": %s, "yAxis": %s, "series": [' % (
+            json.dumps(xaxis), json.dumps(yaxis))
+
+        columns = _columns(pivot, max_points)
+        for i, options in enumerate(_series_options(pivot, yaxis, charts)):
+            yield '%s%s, "data": [' % (', ' if i else '',
+                                       json.dumps(options)[:-1])
+
+            serie, index = next(columns)
+            for start in range(0, len(serie), chunk_size):
+                stop = min(start + chunk_size, len(serie))
+                data = _serialize(serie.iloc[start:stop],
+                                  _slice_index(index, start, stop))
+                yield '%s%s' % (', ' if start else '',
+                                json.dumps(data)[1:-1])
+
+            yield ']}'
+
+        yield ']}'
+
+
+def write_chart(pivot, rows, cols, values, charts, fp,
+                chunk_size=CHUNK_SIZE, max_points=None):
+    '''
+    Write Highcharts JSON of get_chart to the file object fp, see
+    iter_chart_json.
+    '''
+    for chunk in iter_chart_json(pivot, rows, cols, values, charts,
+                                 chunk_size, max_points):
+        fp.write(chunk)
+
+
+def get_series(table, yaxis, charts=None, max_points=None):
+    '''
+    Get Highcharts series of table columns.
+
+    When table has DatetimeIndex longer than max_points, every serie is
+    downsampled by min/max bucketing: index is split into max_points / 2
+    buckets and points with minimal and maximal value of the serie in every
+    bucket are kept.
+    '''
+    with stage('serialize', shape=table.shape):
+        columns = _columns(table, max_points)
+
+        series = []
+        for serie in _series_options(table, yaxis, charts):
+            serie['data'] = _serialize(*next(columns))
+            series.append(serie)
+    return series
+
+
+def _columns(table, max_points=None):
+    '''
+    Get columns of table with their index values, downsampled when
+    max_points is given.
+
+    :return: generator of tuples (serie, index values)
+    '''
+    index = _index_values(table.index)
+    positions = None
+    if max_points and isinstance(table.index, pd.DatetimeIndex) and \
+            len(table) > max_points:
+        positions = _downsample(table.values, max_points)
+
+    for i in range(len(table.columns)):
+        serie = table.iloc[:, i]
+        if positions is None:
+            yield serie, index
+        else:
+            x, strings = index
+            yield serie.iloc[positions[i]], (
+                [x[j] for j in positions[i]], strings)
+
+
+def _downsample(values, max_points):
+    '''
+    Get positions of points kept by min/max bucketing of every column of
+    values, NaN counts as 0.
+
+    :param values: 2-dimensional array
+    :return: list of sorted position arrays, one per column
+    '''
+    values = np.where(pd.isnull(values), 0, values).astype(np.float64)
+    n, k = values.shape
+    buckets = max(max_points // 2, 1)
+    size = -(-n // buckets)
+
+    padding = np.repeat(values[-1:], buckets * size - n, axis=0)
+    shaped = np.concatenate([values, padding]).reshape(buckets, size, k)
+    offsets = (np.arange(buckets) * size)[:, np.newaxis]
+    mins = np.minimum(shaped.argmin(axis=1) + offsets, n - 1)
+    maxs = np.minimum(shaped.argmax(axis=1) + offsets, n - 1)
+
+    return [np.unique(np.concatenate([mins[:, j], maxs[:, j]]))
+            for j in range(k)]
+
+
+def _series_options(table, yaxis, charts=None):
     charts = charts or {}
-    series = []
     axis = _axis_names(yaxis)
-    for i, column in enumerate(table.columns):
+    for column in table.columns:
         name = column[0] if isinstance(column, tuple) else column
         serie = {
             'name': ' / '.join(column) if isinstance(column,
                                                      tuple) else column,
-            'data': _serialize(table[column]),
             'type': charts.get(name, 'column')
         }
 
@@ -47,8 +172,7 @@ def get_series(table, yaxis, charts=None):
             axis_index = axis.index(name)
             if axis_index >= 0:
                 serie['yAxis'] = axis_index
-        series.append(serie)
-    return series
+        yield serie
 
 
 def get_axes(index, names, xaxis=False):
@@ -75,19 +199,76 @@ def get_axes(index, names, xaxis=False):
     return axes[0] if len(axes) == 1 else axes
 
 
-def _serialize(serie):
-    ret = []
-    for x, y in zip(serie.index, serie):
-        if isinstance(x, (date, datetime)):
-            x = unix_time_millis(x)
-        if pd.np.isnan(y):
-            y = 0
+def _serialize(serie, index=None):
+    '''
+    Serialize serie to Highcharts data, NaN values are replaced by 0.
 
-        if isinstance(x, basestring):
-            ret.append(y)
-        else:
-            ret.append((x, y))
-    return ret
+    :param serie: pandas Series
+    :param index: result of _index_values for the serie index, it is
+        computed once for all series of a table
+    :return: list of values for categories, list of (x, y) otherwise
+    '''
+    x, strings = index if index is not None else _index_values(serie.index)
+    y = _serie_values(serie.values)
+
+    if strings is True:
+        return y
+    if strings is False:
+        return list(zip(x, y))
+    return [b if s else (a, b) for a, b, s in zip(x, y, strings)]
+
+
+def _index_values(index):
+    '''
+    Get x values of the index, dates are converted to unix time in millis
+    of their day like unix_time_millis does.
+
+    :return: tuple (x values, strings) where strings is True when all values
+        are strings, False when there is none and list of flags otherwise
+    '''
+    if isinstance(index, pd.DatetimeIndex):
+        days = index.asi8 // DAY_NANOS
+        return (days * 86400.0 * 1000.0).tolist(), False
+
+    x = index.tolist()
+    strings = [isinstance(a, _string_types) for a in x]
+    if all(strings):
+        return x, True
+
+    x = [unix_time_millis(a) if isinstance(a, (date, datetime)) else a
+         for a in x]
+    return x, strings if any(strings) else False
+
+
+def _slice_index(index, start, stop):
+    x, strings = index
+    if isinstance(strings, list):
+        strings = strings[start:stop]
+    return x[start:stop], strings
+
+
+def _serie_values(values):
+    if hasattr(values, 'sp_values'):
+        return _sparse_values(values)
+
+    y = values.tolist()
+    for i in np.flatnonzero(pd.isnull(values)):
+        y[i] = 0
+    return y
+
+
+def _sparse_values(values):
+    '''
+    Get list of sparse array values, only the stored values are read. Gaps
+    and NaN are 0 like in dense series.
+    '''
+    fill_value = values.fill_value
+    fill_value = 0 if pd.isnull(fill_value) else np.asarray(fill_value).item()
+    y = [fill_value] * len(values)
+    stored = _serie_values(np.asarray(values.sp_values))
+    for i, value in zip(values.sp_index.to_int_index().indices, stored):
+        y[i] = value
+    return y
 
 
 def _axis_names(axis):
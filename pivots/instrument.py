@@ -0,0 +1,140 @@
+'''
+Instrumentation of pivot stages.
+
+Listeners are called with an event dictionary for every finished stage of
+any thread:
+
+    def listener(event):
+        statsd.timing('pivot.%s' % event['stage'], event['duration'])
+
+    pivots.instrument.subscribe(listener)
+
+or events of stages of the current thread are collected within a block:
+
+    with pivots.instrument.collect() as events:
+        pivots.pivot_table_from_select(select, rows, cols, values)
+
+Every event has stage name and duration in seconds, stages add:
+
+- compile: sql
+- execute
+- fetch: rows, bytes when fetched into DataFrame
+- convert: rows, bytes
+- reshape: shape, bytes
+- serialize: shape
+
+Durations are measured by a monotonic clock where Python has one. The
+serialize stage of iter_chart_json lasts until the last chunk is taken,
+so it includes time the consumer spends between chunks.
+
+Bytes are an estimate of memory of the resulting arrays. Stages which
+raised have error with the exception class name.
+
+When there is no listener, a stage costs two list checks.
+'''
+import contextlib
+import threading
+import time
+import timeit
+
+
+_listeners = []
+_local = threading.local()
+_clock = getattr(time, 'monotonic', timeit.default_timer)
+
+
+def subscribe(listener):
+    '''
+    :param listener: callable taking event dictionary
+    '''
+    _listeners.append(listener)
+
+
+def unsubscribe(listener):
+    _listeners.remove(listener)
+
+
+@contextlib.contextmanager
+def collect():
+    '''
+    Collect events of stages of the current thread finished within the
+    block into a list.
+    '''
+    events = []
+    collectors = _collectors()
+    collectors.append(events.append)
+    try:
+        yield events
+    finally:
+        collectors.remove(events.append)
+
+
+def stage(name, **info):
+    '''
+    Context manager measuring stage, event details are added by its set
+    method. It is false when nobody listens, so expensive details can be
+    skipped:
+
+        with stage('execute') as s:
+            if s:
+                s.set(sql=str(statement))
+    '''
+    if not _listeners and not getattr(_local, 'collectors', None):
+        return _NO_STAGE
+    return _Stage(name, info)
+
+
+def nbytes(df):
+    '''
+    Estimate memory of DataFrame arrays, object values are counted as
+    pointers and categorical ones as their codes.
+    '''
+    itemsize = sum(getattr(dtype, 'itemsize', 1) for dtype in df.dtypes)
+    return len(df) * itemsize + df.index.nbytes
+
+
+def _collectors():
+    try:
+        return _local.collectors
+    except AttributeError:
+        _local.collectors = []
+        return _local.collectors
+
+
+class _Stage(object):
+    def __init__(self, name, info):
+        self.event = dict(info, stage=name)
+
+    def __enter__(self):
+        self.start = _clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.event['duration'] = _clock() - self.start
+        if exc_type is not None:
+            self.event['error'] = exc_type.__name__
+
+        for listener in list(_listeners) + list(_collectors()):
+            listener(self.event)
+
+    def set(self, **info):
+        self.event.update(info)
+
+
+class _NoStage(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def set(self, **info):
+        pass
+
+    def __nonzero__(self):
+        return False
+
+    __bool__ = __nonzero__
+
+
+_NO_STAGE = _NoStage()
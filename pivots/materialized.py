@@ -0,0 +1,96 @@
+'''
+Materialized pivot tables of append-only selects.
+
+MaterializedPivot keeps grouped partial aggregates of the select together
+with a watermark, the greatest value of a column which only grows, such
+as an autoincrement id or an insert timestamp:
+
+    pivot = pivots.MaterializedPivot(select, rows='yearmonth', cols='gender',
+                                     values=('avg', 'price'), watermark='id')
+    table = pivot.refresh()
+
+Refresh aggregates only rows past the watermark and merges them into the
+partials, so its cost depends on the number of new rows. Values must be
+re-aggregable, see pivots.query.
+'''
+import pandas as pd
+import sqlalchemy
+from pivots.table import _sanitize_list
+from pivots.query import _fetch_partials, _merge_partials, _partials, \
+    _pivot_table
+
+
+class MaterializedPivot(object):
+    '''
+    Pivot table of the select refreshed incrementally, arguments are the
+    same as to pivots.pivot_table_from_select.
+
+    :param watermark: name of the select column growing with new rows
+    '''
+
+    def __init__(self, select, rows, cols, values, watermark):
+        self.select = select
+        self.rows = _sanitize_list(rows)
+        self.cols = _sanitize_list(cols)
+        self.values = _sanitize_list(values)
+        self.partials = _partials(self.values)
+        if self.partials is None:
+            raise ValueError('Values %r are not re-aggregable' % (values,))
+
+        self.watermark = None
+        self.data = None
+
+        base = select.alias('pivot_base')
+        column = base.c[watermark]
+        high = sqlalchemy.bindparam('pivot_watermark_high', type_=column.type)
+        low = sqlalchemy.bindparam('pivot_watermark_low', type_=column.type)
+
+        self._high_select = sqlalchemy.select(
+            [sqlalchemy.func.max(select.c[watermark])])
+        self._initial_select = sqlalchemy.select([base]).where(column <= high)
+        self._delta_select = sqlalchemy.select([base]).where(
+            sqlalchemy.and_(column > low, column <= high))
+
+    def refresh(self):
+        '''
+        Aggregate rows added since the last refresh into the partials.
+
+        The watermark is read before the rows are aggregated, so rows
+        inserted meanwhile are left for the next refresh.
+
+        :return: pivot table, see table
+        '''
+        high = self._high_select.execute(bind=self.select.bind).scalar()
+        if high is None or high == self.watermark:
+            return self.table()
+
+        if self.watermark is None:
+            delta = _fetch_partials(self._initial_select, self.rows,
+                                    self.cols, self.partials,
+                                    params={'pivot_watermark_high': high})
+        else:
+            delta = _fetch_partials(self._delta_select, self.rows, self.cols,
+                                    self.partials,
+                                    params={'pivot_watermark_low':
+                                            self.watermark,
+                                            'pivot_watermark_high': high})
+
+        if self.data is None:
+            self.data = delta
+        elif len(delta):
+            self.data = _merge_partials(
+                pd.concat([self.data, delta], ignore_index=True),
+                self.rows + self.cols, self.partials)
+        self.watermark = high
+
+        return self.table()
+
+    def table(self):
+        '''
+        Get pivot table from the partials.
+
+        :return: pivot table or None when there is no row
+        '''
+        if self.data is None:
+            return None
+        return _pivot_table(self.data, self.rows, self.cols, self.values)
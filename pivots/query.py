@@ -0,0 +1,270 @@
+'''
+Lazy pivot queries.
+
+PivotQuery records the select, rows, cols, values and filters and runs
+only when the table is requested:
+
+    query = pivots.PivotQuery(select, rows=['yearmonth', 'town'],
+                              cols='gender', values=('avg', 'price'))
+    table = query.table()
+
+    by_month = query.with_rows('yearmonth').table()
+    in_town = query.filter('town', 'BA').table()
+
+Queries are immutable, derived queries share the last grouped result of
+the query they were derived from. A query whose keys and filters are
+coarser than the ones of the result is answered from it without a
+database round trip, when all of its values are re-aggregable: sum,
+count, min, max and avg through sum and count.
+'''
+import collections
+import pandas as pd
+import sqlalchemy
+from pivots.aggregates import MERGE, PARTIALS
+from pivots.buckets import key_name
+from pivots.table import pivot_data_frame, pivot_table_from_select, \
+    _aggr_column_name, _make_unique, _sanitize_list, _unstack
+
+
+class PivotQuery(object):
+    '''
+    Lazy pivot table of the select, arguments are the same as to
+    pivots.pivot_table_from_select.
+
+    :param filters: dictionary column name -> value or list of values
+    '''
+
+    def __init__(self, select, rows, cols, values, filters=None):
+        self.select = select
+        self.rows = _sanitize_list(rows)
+        self.cols = _sanitize_list(cols)
+        self.values = _sanitize_list(values)
+        self.filters = dict(
+            (column, _filter_values(value))
+            for column, value in (filters or {}).items())
+        self._result = _Result()
+
+    def with_rows(self, rows):
+        return self._derive(rows=rows)
+
+    def with_cols(self, cols):
+        return self._derive(cols=cols)
+
+    def with_values(self, values):
+        return self._derive(values=values)
+
+    def filter(self, column, value):
+        '''
+        Get query keeping only rows with column equal to value or to one of
+        values when it is a list. Filter of the same column is replaced.
+        '''
+        filters = dict(self.filters)
+        filters[column] = value
+        return self._derive(filters=filters)
+
+    def unfilter(self, column):
+        filters = dict(self.filters)
+        filters.pop(column, None)
+        return self._derive(filters=filters)
+
+    def table(self):
+        '''
+        Get pivot table, from the last grouped result when possible.
+
+        :return: pivot table or None for empty result
+        '''
+        partials = _partials(self.values)
+        if partials is None:
+            return pivot_table_from_select(self._filtered_select(),
+                                           self.rows, self.cols, self.values)
+
+        df = self._result.answer(self.rows + self.cols, self.filters,
+                                 partials)
+        if df is None:
+            df = self._fetch(partials)
+
+        return _pivot_table(df, self.rows, self.cols, self.values)
+
+    def _derive(self, **changes):
+        arguments = {
+            'rows': self.rows,
+            'cols': self.cols,
+            'values': self.values,
+            'filters': self.filters,
+        }
+        arguments.update(changes)
+        query = PivotQuery(self.select, **arguments)
+        query._result = self._result
+        return query
+
+    def _fetch(self, partials):
+        df = _fetch_partials(self._filtered_select(), self.rows, self.cols,
+                             partials)
+        self._result.set(self.rows + self.cols, self.filters, partials, df)
+        return df
+
+    def _filtered_select(self):
+        if not self.filters:
+            return self.select
+
+        select = self.select.alias('pivot_query')
+        conditions = [select.c[column].in_(values)
+                      for column, values in sorted(self.filters.items())]
+        return sqlalchemy.select([select]).where(sqlalchemy.and_(*conditions))
+
+
+class _Result(object):
+    '''
+    Grouped partial aggregates shared by derived queries.
+    '''
+
+    def __init__(self):
+        self.keys = None
+        self.filters = None
+        self.partials = None
+        self.df = None
+
+    def set(self, keys, filters, partials, df):
+        self.keys = list(keys)
+        self.filters = dict(filters)
+        self.partials = list(partials)
+        self.df = df
+
+    def answer(self, keys, filters, partials):
+        '''
+        Get partials grouped by keys with filters applied from the result.
+
+        :return: DataFrame or None when the result does not cover them
+        '''
+        if self.df is None:
+            return None
+
+        if not set(keys) <= set(self.keys) or \
+                not set(partials) <= set(self.partials):
+            return None
+
+        for column, values in self.filters.items():
+            if column not in filters or \
+                    not set(filters[column]) <= set(values):
+                return None
+
+        local = [(column, values) for column, values in filters.items()
+                 if column not in self.filters or
+                 set(self.filters[column]) != set(values)]
+        if any(column not in self.keys for column, _ in local):
+            return None
+
+        df = self.df
+        for column, values in local:
+            df = df[df[key_name(column)].isin(values)]
+
+        return _merge_partials(df, keys, partials)
+
+
+def _partials(values):
+    '''
+    Get partial aggregates of values as (column, function) tuples.
+
+    :return: list of partials or None when a value is not re-aggregable
+    '''
+    partials = []
+    for value in values:
+        name, func_name = _aggr_column_name(value)
+        if func_name not in PARTIALS:
+            return None
+        partials.extend((name, partial) for partial in PARTIALS[func_name])
+    return _make_unique(partials)
+
+
+def _fetch_partials(select, rows, cols, partials, params=None):
+    '''
+    Get DataFrame of keys and partials aggregated in the database.
+    '''
+    values = [(func_name, name) for name, func_name in partials]
+    df = pivot_data_frame(select, rows, cols, values, categorical=False,
+                          params=params)
+    df.columns = _key_names(rows + cols) + [_partial_name(partial)
+                                            for partial in partials]
+    return df
+
+
+def _merge_partials(df, keys, partials):
+    '''
+    Get partials of df aggregated by keys, sums of NaN only are NaN like
+    in the database.
+    '''
+    merge = collections.OrderedDict(
+        (_partial_name(partial), MERGE[partial[1]]) for partial in partials)
+    grouped = df.groupby(_key_names(keys), sort=False)
+    merged = collections.OrderedDict(
+        (name, _sum(grouped[name]) if func_name == 'sum'
+         else getattr(grouped[name], func_name)())
+        for name, func_name in merge.items())
+    return pd.DataFrame(merged, columns=list(merge)).reset_index()
+
+
+def _sum(grouped):
+    try:
+        return grouped.sum(min_count=1)
+    except TypeError:
+        # pandas < 0.22 sums NaN only to NaN
+        return grouped.sum()
+
+
+def _pivot_table(df, rows, cols, values):
+    '''
+    Get pivot table of values computed from partials in df.
+    '''
+    names = _value_names(values)
+    df = _finalize(df, _key_names(rows + cols), values, names)
+    if len(df):
+        return _unstack(df, rows, cols, names)
+    return None
+
+
+def _filter_values(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(value)
+    return (value,)
+
+
+def _value_names(values):
+    '''
+    Get names of values like _aggr_column_names, one per value.
+    '''
+    functions = collections.defaultdict(list)
+    for value in values:
+        name, func_name = _aggr_column_name(value)
+        functions[name].append(func_name)
+
+    names = []
+    for value in values:
+        name, func_name = _aggr_column_name(value)
+        if len(functions[name]) > 1:
+            name = '%s_%s' % (name, func_name)
+        names.append(name)
+    return names
+
+
+def _partial_name(partial):
+    return '%s_%s' % (partial[1], partial[0])
+
+
+def _finalize(df, keys, values, names):
+    '''
+    Get DataFrame with keys and values computed from partials.
+    '''
+    columns = collections.OrderedDict((key, df[key]) for key in keys)
+    for value, name in zip(values, names):
+        column, func_name = _aggr_column_name(value)
+        if func_name in ('avg', 'mean'):
+            columns[name] = (df[_partial_name((column, 'sum'))] /
+                             df[_partial_name((column, 'count'))])
+        else:
+            columns[name] = df[
+                _partial_name((column, PARTIALS[func_name][0]))]
+    return pd.DataFrame(columns, columns=keys + names)
+
+
+def _key_names(keys):
+    return [key_name(key) for key in keys]
@@ -0,0 +1,101 @@
+'''
+Sparse pivot tables, requires scipy and pandas 0.25. The module is not
+imported by pivots.
+
+Pivot of high cardinality rows and cols, e.g. customers and products, has
+mostly missing cells. Sparse table stores only the aggregated cells:
+
+    table = pivots.sparse.pivot_table_sparse(select, rows='customer_id',
+                                             cols='product', values='price')
+
+Columns of the table are pandas SparseArrays filled with NaN.
+'''
+import collections
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from pivots.instrument import stage
+from pivots.table import pivot_data_frame, _aggr_column_names, \
+    _bucket_dates, _factorize, _key_names, _pivot_columns, _sanitize_list
+
+if not hasattr(pd.DataFrame, 'sparse'):
+    raise ImportError('pivots.sparse requires pandas 0.25 or newer')
+
+
+def pivot_table_sparse(select, rows, cols, values, **options):
+    '''
+    Get sparse pivot table for the select, options are passed to
+    pivots.pivot_data_frame.
+
+    :return: pivot table or None for empty result
+    '''
+    df = pivot_data_frame(select, rows, cols, values, **options)
+    if len(df):
+        return unstack_sparse(df, rows, cols, _aggr_column_names(values))
+    return None
+
+
+def unstack_sparse(df, rows, cols, values):
+    '''
+    Reshape aggregated data with unique rows and cols keys into sparse
+    pivot table with the same index and columns as pivots.pivot_table.
+    '''
+    with stage('reshape') as s:
+        matrix, index, columns = pivot_matrix(df, rows, cols, values)
+
+        pivot = pd.DataFrame.sparse.from_spmatrix(matrix, index=index)
+        pivot = pd.DataFrame(collections.OrderedDict(
+            (i, _nan_filled(pivot.iloc[:, i].values))
+            for i in range(len(columns))), index=index)
+        pivot.columns = columns
+
+        if s:
+            s.set(shape=pivot.shape,
+                  bytes=matrix.data.nbytes + matrix.indices.nbytes)
+    return pivot
+
+
+def pivot_matrix(df, rows, cols, values):
+    '''
+    Get aggregated data as a sparse matrix with pivot table index and
+    columns. Values are converted to float, columns without any value are
+    left out.
+
+    :return: tuple (scipy.sparse.csc_matrix, index, columns)
+    '''
+    rows = _sanitize_list(rows)
+    cols = _sanitize_list(cols)
+    values = sorted(values)
+
+    df = _bucket_dates(df, rows + cols)
+    rows = _key_names(rows)
+    cols = _key_names(cols)
+    df = df.dropna(how='all', subset=values).dropna(subset=rows + cols)
+    row_codes, row_index = _factorize(df, rows)
+    col_codes, col_index = _factorize(df, cols)
+    width = len(col_index) or 1
+
+    data, positions = [], []
+    for i, value in enumerate(values):
+        array = df[value].values.astype(np.float64)
+        present = np.flatnonzero(~np.isnan(array))
+        data.append(array[present])
+        positions.append((row_codes[present], col_codes[present] + i * width))
+
+    matrix = scipy.sparse.coo_matrix(
+        (np.concatenate(data),
+         (np.concatenate([r for r, _ in positions]),
+          np.concatenate([c for _, c in positions]))),
+        shape=(len(row_index), width * len(values))).tocsc()
+
+    used = np.flatnonzero(np.diff(matrix.indptr))
+    columns = _pivot_columns(values, cols, col_index)
+    return matrix[:, used], row_index, columns[used]
+
+
+def _nan_filled(array):
+    '''
+    Get SparseArray with the same stored values and NaN fill value.
+    '''
+    return pd.arrays.SparseArray(array.sp_values, sparse_index=array.sp_index,
+                                 fill_value=np.nan)
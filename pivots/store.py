@@ -0,0 +1,239 @@
+'''
+Store of pivot tables shared by processes on one host.
+
+Pivot tables are written into files in shared memory (/dev/shm, the
+temporary directory where it is missing) and read by other processes as
+memory mapped arrays, so every worker of a web server maps the same pages
+instead of querying and reshaping the table again. The default directory
+is private to the user:
+
+    store = pivots.SharedStore(ttl=300)
+    table = store.pivot_table(select, rows, cols, values)
+
+Tables are stored under keys of the compiled pivot select, its parameters
+and options, see pivot_key. Chart JSON of a stored table can be stored
+next to it:
+
+    chart = store.get_chart(key)
+    if chart is None:
+        chart = store.set_chart(key, table, rows, cols, values, charts)
+
+Entries older than ttl seconds are removed when read or by cleanup. Files
+mapped by a process stay valid after they are removed.
+'''
+import hashlib
+import os
+import pickle
+import tempfile
+import numpy as np
+import pandas as pd
+from pivots.cache import Cache, statement_key, statement_tables
+from pivots.highcharts import iter_chart_json
+from pivots.table import pivot_table_from_select, _compile_pivot_select
+
+
+SHARED_MEMORY = '/dev/shm'
+
+
+class SharedStore(Cache):
+    '''
+    Cache of numeric pivot tables in memory mapped files of directory, a
+    directory in shared memory by default.
+
+    Every table is stored in one .pivot file: pickled tables it was read
+    from, pickled index and columns and the values as one float or int
+    array in .npy format, which is memory mapped.
+
+    The directory is created with mode 0700. ValueError is raised when it
+    is owned by another user or accessible by others, who could read or
+    replace the stored tables.
+    '''
+
+    suffix = '.pivot'
+
+    def __init__(self, directory=None, ttl=None):
+        super(SharedStore, self).__init__(ttl)
+        if directory is None:
+            directory = os.path.join(
+                SHARED_MEMORY if os.path.isdir(SHARED_MEMORY)
+                else tempfile.gettempdir(), 'pivots-%d' % os.getuid())
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        _check_directory(directory)
+
+    def __len__(self):
+        return len(self._keys())
+
+    def pivot_table(self, select, rows, cols, values, params=None,
+                    **options):
+        '''
+        Get pivot table from the store, the table is computed by
+        pivots.pivot_table_from_select and stored when it is missing.
+
+        Sparse and approximate tables cannot be stored, ValueError is raised
+        for these options.
+
+        :return: pivot table or None for empty result
+        '''
+        for name in ('sparse', 'approximate'):
+            if options.get(name) not in (None, False):
+                raise ValueError('%s pivot tables cannot be stored' % name)
+
+        key = pivot_key(select, rows, cols, values, params, **options)
+        pivot = self.get(key)
+        if pivot is None:
+            pivot = pivot_table_from_select(select, rows, cols, values,
+                                            params=params, **options)
+            if pivot is not None:
+                self.set(key, pivot, statement_tables(select))
+        return pivot
+
+    def get_chart(self, key):
+        '''
+        :return: chart JSON stored for the key or None
+        '''
+        try:
+            with open(self._path(key, '.chart'), 'rb') as f:
+                return f.read().decode('utf-8')
+        except (IOError, OSError):
+            return None
+
+    def set_chart(self, key, pivot, rows, cols, values, charts,
+                  max_points=None):
+        '''
+        Store Highcharts JSON of the pivot table, see
+        pivots.iter_chart_json.
+
+        :return: chart JSON
+        '''
+        chart = ''.join(iter_chart_json(pivot, rows, cols, values, charts,
+                                        max_points=max_points))
+        self._write(self._path(key, '.chart'),
+                    lambda f: f.write(chart.encode('utf-8')))
+        return chart
+
+    def cleanup(self):
+        '''
+        Remove entries older than ttl.
+
+        :return: number of removed entries
+        '''
+        removed = 0
+        for key in self._keys():
+            try:
+                if self._expired(os.path.getmtime(self._path(key))):
+                    self._remove(key)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def _path(self, key, suffix=suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    def _keys(self):
+        return [name[:-len(self.suffix)]
+                for name in os.listdir(self.directory)
+                if name.endswith(self.suffix)]
+
+    def _get(self, key):
+        path = self._path(key)
+        try:
+            if self._expired(os.path.getmtime(path)):
+                self._remove(key)
+                self._count('evictions')
+                return None
+
+            with open(path, 'rb') as f:
+                pickle.load(f)
+                index, columns = pickle.load(f)
+                version = np.lib.format.read_magic(f)
+                read_header = getattr(np.lib.format,
+                                      'read_array_header_%d_%d' % version)
+                shape, fortran_order, dtype = read_header(f)
+                offset = f.tell()
+            values = np.memmap(path, dtype=dtype, mode='r', offset=offset,
+                               shape=shape,
+                               order='F' if fortran_order else 'C')
+        except (IOError, OSError, EOFError, ValueError):
+            return None
+
+        return pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+    def _set(self, key, pivot, tables):
+        if not isinstance(pivot, pd.DataFrame) or _is_sparse(pivot):
+            raise ValueError('Only dense DataFrames can be stored')
+        values = np.ascontiguousarray(pivot.values)
+        if values.dtype.kind not in 'iufb':
+            raise ValueError('Only numeric pivot tables can be stored')
+
+        def _dump(f):
+            pickle.dump(tables, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump((pivot.index, pivot.columns), f,
+                        pickle.HIGHEST_PROTOCOL)
+            np.lib.format.write_array(f, values)
+
+        self._write(self._path(key), _dump)
+
+    def _invalidate(self, tables):
+        for key in self._keys():
+            if tables is not None:
+                try:
+                    with open(self._path(key), 'rb') as f:
+                        if not pickle.load(f) & tables:
+                            continue
+                except (IOError, OSError, EOFError):
+                    continue
+            self._remove(key)
+
+    def _write(self, path, dump):
+        '''
+        Write file by dump function taking file object, the file is renamed
+        to path when complete.
+        '''
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                dump(f)
+            os.rename(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _remove(self, key):
+        for suffix in (self.suffix, '.chart'):
+            try:
+                os.remove(self._path(key, suffix))
+            except OSError:
+                pass
+
+
+def _check_directory(directory):
+    '''
+    Raise ValueError when directory is not owned by the user or is
+    accessible by group or others.
+    '''
+    status = os.stat(directory)
+    if status.st_uid != os.getuid() or status.st_mode & 0o077:
+        raise ValueError('Directory %s must be owned by the user and not '
+                         'accessible by others' % directory)
+
+
+def _is_sparse(pivot):
+    return any(hasattr(pivot.iloc[:, i].values, 'sp_values')
+               for i in range(len(pivot.columns)))
+
+
+def pivot_key(select, rows, cols, values, params=None, **options):
+    '''
+    Get key of pivot table of the select from the compiled pivot select,
+    its parameters and options of pivots.pivot_table_from_select. Cache
+    option does not change the table and is left out.
+    '''
+    pivot_select = _compile_pivot_select(select, rows, cols, values,
+                                         use_aggregates=not params)
+    key = statement_key(pivot_select, select.bind, params)
+    options = sorted((name, option) for name, option in options.items()
+                     if name != 'cache')
+    return hashlib.sha1(repr((key, options)).encode('utf-8')).hexdigest()
@@ -1,34 +1,160 @@
 import collections
 from decimal import Decimal
+import numbers
 from functools import partial
+from multiprocessing.pool import ThreadPool
+import numpy as np
 import sqlalchemy
+from sqlalchemy.sql.util import ClauseAdapter
+from sqlalchemy.sql.visitors import traverse
 import pandas as pd
+from pivots import aggregates
+from pivots.buckets import TimeBucket, key_name, truncate
+from pivots.cache import statement_key, statement_tables
+from pivots.instrument import stage, nbytes
+
+
+CHUNK_SIZE = 10000
+MAX_COL_KEYS = 100
+PARTITIONS = 8
+STREAM_FOLD_CHUNKS = 16
+MARGINS_NAME = 'All'
+STATEMENT_CACHE_SIZE = 500
+OTHER_NAME = 'Other'
+SAMPLE_MODULUS = 10007
+TABLESAMPLE_DIALECTS = ('postgresql',)
+GROUPING_SETS_DIALECTS = ('postgresql', 'mssql', 'oracle')
+
+try:
+    _string_types = basestring
+except NameError:
+    _string_types = str
+
+# pivot_table of pandas < 0.14 keeps all NaN rows and columns
+_LEGACY_PIVOT = tuple(int(a) for a in pd.__version__.split('.')[:2]) < (0, 14)
+
+_statements = sqlalchemy.util.LRUCache(STATEMENT_CACHE_SIZE)
+_compiled = sqlalchemy.util.LRUCache(STATEMENT_CACHE_SIZE)
+_compiled_cache = sqlalchemy.util.LRUCache(STATEMENT_CACHE_SIZE)
 
 
 def pivot_table(data, rows, cols, values, aggfunc):
     columns = _column_names(rows, cols, _aggr_column_names(values))
 
     if data:
-        def _preprocess_row(row):
-            return [float(a) if isinstance(a, Decimal) else a for a in row]
+        df = _data_frame(data, columns)
 
-        data = map(_preprocess_row, data)
+        return _pivot_frame(df, rows, cols, values, aggfunc)
 
-        df = pd.DataFrame(data, columns=columns)
 
-        pivot = df.pivot_table(rows=rows, cols=cols, values=values,
-                               aggfunc=aggfunc)
-        return pivot
+def pivot_table_from_select(select, rows, cols, values, columnar=False,
+                            stream=False, sql_pivot=False, col_keys=None,
+                            max_col_keys=MAX_COL_KEYS, cache=None,
+                            partition=None, partitions=PARTITIONS,
+                            margins=False, params=None, max_cols=None,
+                            top_by=None, approximate=None,
+                            sample_column=None, sparse=False):
+    '''
+    Get pivot table for the select.
+
+    Params are passed to the functions computing the table. Max_cols and
+    top_by are passed to pivot_data and pivot_data_frame, cache to
+    pivot_data only. Margins, approximate, sql_pivot or col_keys, stream,
+    sparse, columnar and partition choose how the table is computed and
+    cannot be combined, ValueError is raised for options not supported by
+    the chosen way.
+
+    With margins=True subtotals and grand totals aggregated in the
+    database are added, see pivot_table_margins.
+
+    With approximate set to a fraction of rows, the values are estimated
+    from a sample of the select, see pivot_table_sampled.
+
+    Cache is passed to pivot_data. When partition is given, the data are
+    fetched by pivot_data_partitioned.
+
+    With sql_pivot=True or with col_keys the table is reshaped in the
+    database, see pivot_table_sql. Keys of cols are discovered with
+    pivot_col_keys unless col_keys are given. When more than max_col_keys
+    keys are discovered, the table is reshaped in pandas as usual. Given
+    col_keys select the columns of the table, so they are always reshaped
+    in the database.
+
+    With columnar=True the aggregated data are fetched by pivot_data_frame,
+    which avoids building a list of row tuples.
+
+    With sparse=True the table is a pandas sparse frame built from the
+    aggregated data without the dense table, see pivots.sparse. Requires
+    scipy and pandas 0.25.
+
+    With stream=True the aggregated data are read in chunks from a server
+    side cursor and merged into a running partial pivot, see
+    pivot_table_streamed.
+    '''
+    modes = [name for name, option in [
+        ('margins', margins), ('approximate', approximate is not None),
+        ('sql_pivot', sql_pivot or col_keys is not None), ('stream', stream),
+        ('sparse', sparse), ('columnar', columnar),
+        ('partition', partition is not None)] if option]
+    if len(modes) > 1:
+        raise ValueError('Options %s cannot be combined' % ', '.join(modes))
+    if modes and cache is not None:
+        raise ValueError('Option cache cannot be used with %s' % modes[0])
+    if (max_cols is not None or top_by is not None) and \
+            modes not in ([], ['sparse'], ['columnar']):
+        raise ValueError('Option max_cols cannot be used with %s' % modes[0])
+
+    if margins:
+        return pivot_table_margins(select, rows, cols, values, params=params)
+
+    if approximate is not None:
+        table, _ = pivot_table_sampled(select, rows, cols, values,
+                                       approximate, sample_column,
+                                       params=params)
+        return table
+
+    if (sql_pivot or col_keys is not None) and _sanitize_list(cols):
+        if col_keys is not None:
+            return pivot_table_sql(select, rows, cols, values, col_keys,
+                                   params=params)
+
+        col_keys = pivot_col_keys(select, cols, limit=max_col_keys + 1,
+                                  params=params)
+        if len(col_keys) <= max_col_keys:
+            return pivot_table_sql(select, rows, cols, values, col_keys,
+                                   params=params)
 
+    if stream:
+        return pivot_table_streamed(select, rows, cols, values,
+                                    params=params)
 
-def pivot_table_from_select(select, rows, cols, values):
-    data = pivot_data(select, rows, cols, values)
+    if sparse:
+        from pivots.sparse import pivot_table_sparse
+        return pivot_table_sparse(select, rows, cols, values, params=params,
+                                  max_cols=max_cols, top_by=top_by)
+
+    if columnar:
+        df = pivot_data_frame(select, rows, cols, values, params=params,
+                              max_cols=max_cols, top_by=top_by)
+        values = _aggr_column_names(values)
+        if len(df):
+            return _unstack(df, rows, cols, values)
+        return None
+
+    if partition is not None:
+        data = pivot_data_partitioned(select, rows, cols, values, partition,
+                                      partitions, params=params)
+    else:
+        data = pivot_data(select, rows, cols, values, cache=cache,
+                          params=params, max_cols=max_cols, top_by=top_by)
     values = _aggr_column_names(values)
-    aggfunc = 'mean'
-    return pivot_table(data, rows, cols, values, aggfunc)
+    if data:
+        df = _data_frame(data, _column_names(rows, cols, values))
+        return _unstack(df, rows, cols, values)
 
 
-def pivot_data(select, rows, cols, values):
+def pivot_data(select, rows, cols, values, cache=None, params=None,
+               max_cols=None, top_by=None, other=OTHER_NAME):
     '''
     Get aggregated data for pivot table.
 
@@ -39,7 +165,9 @@ def pivot_data(select, rows, cols, values):
     )
     group by rows, cols
 
-    Rows and cols are either string or list of strings.
+    Rows and cols are either string or list of strings. Instead of a
+    column name, pivots.TimeBucket groups by the column truncated to the
+    bucket grain, see pivots.buckets.
 
     Values can be:
     - string
@@ -49,30 +177,1126 @@ def pivot_data(select, rows, cols, values):
 
     All strings are column names in the select.
 
+    The pivot select is built and compiled once for the same select object,
+    rows, cols and values. Filters whose values change between calls should
+    be bind parameters of the select with values passed in params:
+
+    select = table.select().where(table.c.town == sqlalchemy.bindparam('town'))
+    pivot_data(select, rows, cols, values, params={'town': 'BA'})
+
     Aggregation function is a string one of:
     - sum, count, avg, stddev etc...
 
+    With max_cols only keys of cols with the greatest top_by aggregate, the
+    first value by default, are kept, the other keys are aggregated
+    together as one key with every column equal to other:
+
+    select rows, case when top.key is null then other else cols end, values
+    from select left join (
+        select cols from select group by cols order by top_by desc
+        limit max_cols
+    ) top on cols = top.cols
+    group by rows, case ...
+
+    Other must be a valid value of all cols columns.
+
+    Without max_cols and params the data are read from the smallest
+    aggregate table registered for the select covering rows, cols and
+    values, see pivots.aggregates. Aggregate tables hold data of the
+    parameters of the select, so they are not used with params.
+
     :param executor: sqlalchemy engine, connection or session
     :param select: select providing the data, which will be further aggregated
     :param rows: group columns as rows
     :param cols: group columns as columns
     :param values: aggregated columns
+    :param cache: pivots.cache.Cache, data are cached under the compiled
+        pivot select and its parameters
+    :param params: values of bind parameters of the select
+    :param max_cols: maximal number of cols keys
+    :param top_by: value ranking cols keys, as in values
+    :param other: cols value of the key aggregating the remaining keys
     :return:
     '''
+    pivot_select = _compile_pivot_select(select, rows, cols, values,
+                                         max_cols=max_cols, top_by=top_by,
+                                         other=other,
+                                         use_aggregates=not params)
+
+    if cache is not None:
+        key = statement_key(pivot_select, select.bind, params,
+                            compiled=_compile(pivot_select, select.bind))
+        data = cache.get(key)
+        if data is None:
+            data = _execute(pivot_select, select.bind, params)
+            cache.set(key, data, statement_tables(pivot_select))
+        return data
+
+    return _execute(pivot_select, select.bind, params)
+
+
+def pivot_data_partitioned(select, rows, cols, values, partition,
+                           partitions=PARTITIONS, workers=None, params=None):
+    '''
+    Get aggregated data for pivot table, partitions are aggregated
+    concurrently on separate connections of the select bind.
+
+    Partition is a name of one of rows or cols, or an expression of them,
+    e.g. select.c.customer_id / 1000. Integer partitions are split by
+    the remainder of division by partitions, numeric and date partitions
+    into partitions ranges between their minimum and maximum. pivot_data
+    is executed for every partition in a thread pool. Partitions have
+    disjoint group keys, so the results are just concatenated.
+
+    :param select: select providing the data, which will be further aggregated
+    :param rows: group columns as rows
+    :param cols: group columns as columns
+    :param values: aggregated columns
+    :param partition: column name or expression of group columns
+    :param partitions: number of partitions
+    :param workers: number of threads, number of partitions when None
+    :param params: values of bind parameters of the select
+    :return: same as pivot_data
+    '''
+    keys = _sanitize_list(rows) + _sanitize_list(cols)
+    if not isinstance(partition, sqlalchemy.sql.ClauseElement):
+        if partition not in keys:
+            raise ValueError('Partition %r is not one of rows or cols' % (
+                partition,))
+        partition = _column(select, partition)
+
+    names = set()
+    traverse(partition, {}, {'column': lambda column: names.add(column.name)})
+    if not names or not names <= set(keys):
+        raise ValueError('Partition must be an expression of rows or cols')
+
+    conditions = _partition_conditions(select, partition, partitions, params)
+
+    def _pivot_data(condition):
+        # conditions are on columns of the select, not of aggregate tables
+        pivot_select = _pivot_select(select, rows, cols, values,
+                                     use_aggregates=False)
+        result = _execute_result(pivot_select.where(condition), select.bind,
+                                 params)
+        try:
+            return list(map(tuple, result.fetchall()))
+        finally:
+            result.close()
+
+    if not conditions:
+        return []
+
+    pool = ThreadPool(workers or len(conditions))
+    try:
+        parts = pool.map(_pivot_data, conditions)
+    finally:
+        pool.close()
+
+    return [row for part in parts for row in part]
+
+
+def _partition_conditions(select, partition, partitions, params=None):
+    '''
+    Get conditions of rows of the partitions, nulls are in the first one.
+    '''
+    if isinstance(partition.type, sqlalchemy.Integer):
+        remainder = sqlalchemy.func.abs(partition % partitions)
+        conditions = [remainder == i for i in range(partitions)]
+    elif isinstance(partition.type, (sqlalchemy.Numeric, sqlalchemy.Date,
+                                     sqlalchemy.DateTime)):
+        bounds = sqlalchemy.select([sqlalchemy.func.min(partition),
+                                    sqlalchemy.func.max(partition)])
+        result = _execute_result(bounds, select.bind, params)
+        try:
+            low, high = result.first()
+        finally:
+            result.close()
+        if low is None:
+            return []
+
+        limits = _make_unique(low + (high - low) * i / partitions
+                              for i in range(1, partitions))
+        conditions = [partition < limits[0]] + [
+            sqlalchemy.and_(partition >= limit, partition < next_limit)
+            for limit, next_limit in zip(limits, limits[1:])
+        ] + [partition >= limits[-1]]
+    else:
+        raise ValueError('Partition must be an integer, numeric or date '
+                         'expression, not %s' % partition.type)
+
+    conditions[0] = sqlalchemy.or_(conditions[0], partition == None)
+    return conditions
+
+
+def pivot_data_frame(select, rows, cols, values, chunk_size=CHUNK_SIZE,
+                     categorical=True, params=None, max_cols=None,
+                     top_by=None, other=OTHER_NAME):
+    '''
+    Get aggregated data for pivot table as a DataFrame.
+
+    Arguments are the same as to pivot_data. The result is fetched in chunks
+    of chunk_size rows into one numpy array per column, so no list of row
+    tuples is created. Decimal columns are converted to float per chunk.
+
+    With categorical=True rows and cols columns of strings are stored as
+    pandas Categorical, i.e. integer codes of their unique values. They are
+    encoded chunk by chunk while fetching, so the strings of the whole
+    result are never held at once.
+
+    :param select: select providing the data, which will be further aggregated
+    :param rows: group columns as rows
+    :param cols: group columns as columns
+    :param values: aggregated columns
+    :param chunk_size: number of rows fetched at once
+    :param categorical: encode rows and cols columns as Categorical
+    :param params: values of bind parameters of the select
+    :return: DataFrame with rows, cols and values columns
+    '''
+    keys = _sanitize_list(rows) + _sanitize_list(cols)
+    columns = _column_names(rows, cols, _aggr_column_names(values))
+    pivot_select = _compile_pivot_select(select, rows, cols, values,
+                                         max_cols=max_cols, top_by=top_by,
+                                         other=other,
+                                         use_aggregates=not params)
+    result = _execute_result(pivot_select, select.bind, params)
+
+    with stage('fetch') as s:
+        encoded = [i for i, key in enumerate(keys)
+                   if not isinstance(key, TimeBucket)] if categorical else []
+        arrays = _fetch_arrays(result, len(columns), chunk_size,
+                               categorical=encoded)
+
+        df = pd.DataFrame(collections.OrderedDict(zip(columns, arrays)),
+                          columns=columns)
+        df = _bucket_dates(df, keys)
+        if s:
+            s.set(rows=len(df), bytes=nbytes(df))
+
+    return df
+
+
+def pivot_data_chunks(select, rows, cols, values, chunk_size=CHUNK_SIZE,
+                      params=None):
+    '''
+    Get aggregated data for pivot table as DataFrames of at most chunk_size
+    rows.
+
+    The select is executed with stream_results, so drivers supporting server
+    side cursors do not load the whole result into memory.
+
+    :param select: select providing the data, which will be further aggregated
+    :param rows: group columns as rows
+    :param cols: group columns as columns
+    :param values: aggregated columns
+    :param chunk_size: number of rows fetched at once
+    :param params: values of bind parameters of the select
+    :return: generator of DataFrames with rows, cols and values columns
+    '''
+    columns = _column_names(rows, cols, _aggr_column_names(values))
+    pivot_select = _pivot_select(select, rows, cols, values,
+                                 use_aggregates=not params)
+
+    result = _execute_result(
+        pivot_select.execution_options(stream_results=True), select.bind,
+        params)
+    try:
+        for df in _fetch_frames(result, columns, chunk_size):
+            yield df
+    finally:
+        result.close()
+
+
+def pivot_table_streamed(select, rows, cols, values, chunk_size=CHUNK_SIZE,
+                         params=None):
+    '''
+    Get pivot table for the select without holding the whole aggregated
+    result as row tuples in memory.
+
+    Chunks from pivot_data_chunks are indexed by rows and cols keys and
+    folded into one running partial every STREAM_FOLD_CHUNKS chunks. Values
+    are aggregated by the database, which returns every key once, so the
+    partial has one row of typed values per key. Memory depends on the
+    number of distinct keys and chunk_size, a fold copies the partial once
+    per STREAM_FOLD_CHUNKS chunks.
+
+    :param params: values of bind parameters of the select
+    :return: pivot table or None for empty result
+    '''
+    keys = _key_names(_sanitize_list(rows) + _sanitize_list(cols))
+    names = _aggr_column_names(values)
+
+    partial, pending = None, []
+    for df in pivot_data_chunks(select, rows, cols, values, chunk_size,
+                                params):
+        pending.append(df.set_index(keys)[names])
+        if len(pending) >= STREAM_FOLD_CHUNKS:
+            partial, pending = _fold(partial, pending), []
+
+    if partial is None and not pending:
+        return None
+
+    pivot = _fold(partial, pending).sort_index()
+    cols = _key_names(_sanitize_list(cols))
+    if cols:
+        pivot = pivot.unstack(cols)
+    return pivot.dropna(how='all', axis=1)
+
+
+def _fold(partial, frames):
+    return pd.concat(([] if partial is None else [partial]) + frames)
+
+
+def pivot_col_keys(select, cols, limit=None, params=None):
+    '''
+    Get sorted distinct keys of cols in the select.
+
+    :param select: select providing the data
+    :param cols: group columns as columns
+    :param limit: maximal number of keys fetched
+    :param params: values of bind parameters of the select
+    :return: list of tuples
+    '''
+    cols_columns = _columns(select, _sanitize_list(cols))
+    keys_select = sqlalchemy.select(cols_columns).distinct().limit(limit)
+
+    result = _execute_result(keys_select, select.bind, params)
+    try:
+        data = result.fetchall()
+    finally:
+        result.close()
+    return sorted(tuple(key) for key in data if None not in tuple(key))
+
+
+def pivot_table_sql(select, rows, cols, values, col_keys, params=None):
+    '''
+    Get pivot table for the select reshaped in the database.
+
+    For every value and every key of cols one conditional aggregate is
+    selected:
+
+    select rows, sum(case when cols = key then value end), ... from (
+        select
+    )
+    group by rows
+
+    so the database returns the wide table directly. Cols keys without any
+    row are missing in the result, rows with null keys are dropped and rows
+    without any value too, like pivot_table_from_select drops them.
+
+    :param select: select providing the data, which will be further aggregated
+    :param rows: group columns as rows
+    :param cols: group columns as columns
+    :param values: aggregated columns
+    :param col_keys: keys of cols, tuples if there are more cols
+    :param params: values of bind parameters of the select
+    :return: pivot table or None for empty result
+    '''
+    rows = _sanitize_list(rows)
+    cols = _sanitize_list(cols)
+    values = _sanitize_list(values)
+    col_keys = [key if isinstance(key, tuple) else (key,) for key in col_keys]
+
+    rows_columns = _columns(select, rows)
+    cols_columns = _columns(select, cols)
+
+    columns = list(rows_columns)
+    for value in values:
+        name, func_name = _aggr_column_name(value)
+        column = _column(select, name)
+        for key in col_keys:
+            condition = sqlalchemy.and_(
+                *[c == k for c, k in zip(cols_columns, key)])
+            aggregate = _aggregate(column, func_name, condition)
+            columns.append(aggregate.label('value_%d' % len(columns)))
+
+    pivot_select = sqlalchemy.select(columns).group_by(*rows_columns)
+    result = _execute_result(pivot_select, select.bind, params)
+    arrays = _fetch_arrays(result, len(columns), CHUNK_SIZE)
+    present = np.logical_and.reduce(
+        [~pd.isnull(array) for array in arrays[:len(rows)]])
+    arrays = [array[present] for array in arrays]
+    if not len(arrays[0]):
+        return None
+
+    rows = _key_names(rows)
+    if len(rows) == 1:
+        index = pd.Index(arrays[0], name=rows[0])
+    else:
+        index = pd.MultiIndex.from_arrays(arrays[:len(rows)], names=rows)
+
+    # values are float like in pivot_table_from_select
+    pivot = pd.DataFrame(collections.OrderedDict(
+        (i, array.astype(np.float64) if array.dtype.kind in 'iub' else array)
+        for i, array in enumerate(arrays[len(rows):])), index=index)
+    pivot.columns = pd.MultiIndex.from_tuples(
+        [(name,) + key
+         for name in _aggr_column_names(values) for key in col_keys],
+        names=[None] + _key_names(cols))
+
+    if not _LEGACY_PIVOT:
+        pivot = pivot.dropna(how='all')
+    return pivot.dropna(how='all', axis=1).sort_index().sort_index(axis=1)
+
+
+def pivot_many(select, specs, params=None):
+    '''
+    Get pivot tables for several (rows, cols, values) specs of one select.
+
+    All groupings are computed by one statement:
+
+    select grouping_id, rows, cols, values from (select)
+    group by grouping sets ((rows, cols), (rows), ...)
+
+    and the result is split into one pivot table per spec. Databases other
+    than GROUPING_SETS_DIALECTS get union of selects grouped by each set
+    over the select shared as a common table expression.
+
+    :param select: select providing the data, which will be further aggregated
+    :param specs: list of (rows, cols, values) tuples, arguments as to
+        pivot_table_from_select
+    :param params: values of bind parameters of the select
+    :return: list of pivot tables, None for empty ones
+    '''
+    specs = [tuple(_sanitize_list(a) for a in spec) for spec in specs]
+    for rows, cols, _ in specs:
+        _check_buckets(rows + cols, 'pivot_many')
+    grouping_sets = []
+    for rows, cols, _ in specs:
+        if set(rows + cols) not in [set(names) for names in grouping_sets]:
+            grouping_sets.append(tuple(rows + cols))
+    values = _make_unique(value for _, _, spec_values in specs
+                          for value in spec_values)
+
+    statement, dimensions = _grouping_sets_select(select, grouping_sets,
+                                                  values)
+    columns = ['grouping_id'] + dimensions + [
+        'value_%d' % i for i in range(len(values))]
+
+    result = _execute_result(statement, select.bind, params)
+    arrays = _fetch_arrays(result, len(columns), CHUNK_SIZE, convert=False)
+    grouping_ids = arrays[0]
+    arrays = dict(zip(columns, arrays))
+
+    tables = []
+    for rows, cols, spec_values in specs:
+        mask = grouping_ids == [set(names) for names in grouping_sets].index(
+            set(rows + cols))
+        if not mask.any():
+            tables.append(None)
+            continue
+
+        names = _aggr_column_names(spec_values)
+        spec_columns = rows + cols + [
+            'value_%d' % values.index(value) for value in spec_values]
+        df = pd.DataFrame(collections.OrderedDict(
+            (name, _convert_array(arrays[column][mask]))
+            for name, column in zip(rows + cols + names, spec_columns)),
+            columns=rows + cols + names)
+        tables.append(_unstack(df, rows, cols, names))
+
+    return tables
+
+
+def pivot_table_margins(select, rows, cols, values,
+                        margins_name=MARGINS_NAME, params=None):
+    '''
+    Get pivot table for the select with subtotals and grand totals.
+
+    Values are aggregated in the database by every prefix of rows combined
+    with every prefix of cols in one statement, GROUP BY ROLLUP(rows),
+    ROLLUP(cols) where supported, see pivot_many. Non-additive aggregates
+    like avg are correct in totals too. Levels
+    aggregated in a total are labeled margins_name and totals are sorted
+    after the other keys.
+
+    :param params: values of bind parameters of the select
+    :return: pivot table or None for empty result
+    '''
+    rows = _sanitize_list(rows)
+    cols = _sanitize_list(cols)
+    values = _sanitize_list(values)
+    _check_buckets(rows + cols, 'margins')
+
+    grouping_sets = [tuple(rows[:i] + cols[:j])
+                     for i in range(len(rows), -1, -1)
+                     for j in range(len(cols), -1, -1)]
+    statement, dimensions = _grouping_sets_select(
+        select, grouping_sets, values, rollups=[rows, cols])
+    names = _aggr_column_names(values)
+
+    result = _execute_result(statement, select.bind, params)
+    arrays = _fetch_arrays(result, 1 + len(dimensions) + len(values),
+                           CHUNK_SIZE, convert=False)
+    grouping_ids = arrays[0]
+    if not (grouping_ids == 0).any():
+        return None
+
+    for i, grouping_set in enumerate(grouping_sets):
+        mask = grouping_ids == i
+        for name, array in zip(dimensions, arrays[1:]):
+            if name not in grouping_set:
+                array[mask] = margins_name
+
+    df = pd.DataFrame(collections.OrderedDict(
+        zip(dimensions + names, map(_convert_array, arrays[1:]))),
+        columns=dimensions + names)
+    pivot = _unstack(df, rows, cols, names)
+
+    def _order(index):
+        if isinstance(index, pd.MultiIndex):
+            key = lambda i: [(a == margins_name, a) for a in index[i]]
+        else:
+            key = lambda i: (index[i] == margins_name, index[i])
+        return sorted(range(len(index)), key=key)
+
+    return pivot.iloc[_order(pivot.index)].iloc[:, _order(pivot.columns)]
+
+
+def pivot_table_sampled(select, rows, cols, values, fraction,
+                        sample_column=None, params=None):
+    '''
+    Get pivot table estimated from a sample of the select with standard
+    errors of the estimates.
+
+    Every row is sampled with probability fraction. With sample_column,
+    e.g. an id, rows whose hash of the column modulo SAMPLE_MODULUS is below
+    fraction * SAMPLE_MODULUS are sampled, so the sample is the same for
+    every call and dialect. Without it the single table of the select is
+    read with TABLESAMPLE BERNOULLI on dialects supporting it.
+
+    Sum and count are scaled by 1 / fraction, avg, min and max are
+    computed from the sample. Errors are estimated from the sample sums of
+    squares, min and max have no error estimate and their errors are NaN.
+
+    :param select: select providing the data, which will be further aggregated
+    :param rows: group columns as rows
+    :param cols: group columns as columns
+    :param values: sum, count, avg, min or max of columns
+    :param fraction: fraction of sampled rows
+    :param sample_column: name of integer column the sample is hashed from
+    :param params: values of bind parameters of the select
+    :return: tuple (pivot table, pivot table of standard errors), None for
+        empty sample
+    '''
+    rows = _sanitize_list(rows)
+    cols = _sanitize_list(cols)
+    values = _sanitize_list(values)
+
+    sampled, fraction = _sample_select(select, fraction, sample_column)
+    group_columns = _columns(sampled, rows + cols)
+
+    columns = list(group_columns)
+    for value in values:
+        name, func_name = _aggr_column_name(value)
+        column = _column(sampled, name)
+        if func_name in ('min', 'max'):
+            columns.append(_aggregate(column, func_name))
+        elif func_name in ('sum', 'count', len, 'avg', 'mean'):
+            columns += [_aggregate(column, 'sum'),
+                        _aggregate(column, 'count'),
+                        _aggregate(column * column, 'sum')]
+        else:
+            raise ValueError('Cannot estimate %r from a sample' % func_name)
+
+    statement = sqlalchemy.select(columns).group_by(*group_columns)
+    result = _execute_result(statement, select.bind, params)
+    arrays = _fetch_arrays(result, len(columns), CHUNK_SIZE)
+    if not len(arrays[0]):
+        return None, None
+
+    keys = _column_names(rows, cols, [])
+    names = _aggr_column_names(values)
+    estimates = collections.OrderedDict(zip(keys, arrays))
+    errors = collections.OrderedDict(zip(keys, arrays))
+
+    i = len(keys)
+    for value, name in zip(values, names):
+        _, func_name = _aggr_column_name(value)
+        if func_name in ('min', 'max'):
+            estimates[name] = arrays[i].astype(np.float64)
+            errors[name] = np.repeat(np.nan, len(arrays[i]))
+            i += 1
+            continue
+
+        total, count, squares = [np.asarray(a, dtype=np.float64)
+                                 for a in arrays[i:i + 3]]
+        i += 3
+        if func_name in ('count', len):
+            estimates[name] = count / fraction
+            errors[name] = np.sqrt((1 - fraction) * count) / fraction
+        elif func_name == 'sum':
+            estimates[name] = total / fraction
+            errors[name] = np.sqrt((1 - fraction) * squares) / fraction
+        else:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean = total / count
+                variance = np.maximum(squares / count - mean * mean, 0)
+                estimates[name] = mean
+                errors[name] = np.sqrt(variance / count * (1 - fraction))
+
+    table, errors = [
+        _unstack(pd.DataFrame(columns, columns=keys + names), rows, cols,
+                 names)
+        for columns in (estimates, errors)]
+    return table, errors.reindex(index=table.index, columns=table.columns)
+
+
+def _sample_select(select, fraction, sample_column):
+    '''
+    Get select of a sample of the select rows.
+
+    :return: tuple (select, probability of sampling a row)
+    '''
+    if fraction >= 1:
+        return select, 1.0
+
+    if sample_column is not None:
+        base = select.alias('pivot_sample')
+        threshold = int(round(fraction * SAMPLE_MODULUS))
+        column = sqlalchemy.func.abs(_column(base, sample_column))
+        bucket = (column % SAMPLE_MODULUS) * 7919 % SAMPLE_MODULUS
+        sampled = sqlalchemy.select([base]).where(bucket < threshold)
+        return sampled, float(threshold) / SAMPLE_MODULUS
+
+    froms = select.froms
+    if hasattr(sqlalchemy, 'tablesample') and select.bind is not None and \
+            select.bind.dialect.name in TABLESAMPLE_DIALECTS and \
+            len(froms) == 1 and isinstance(froms[0], sqlalchemy.Table):
+        table = sqlalchemy.tablesample(
+            froms[0], sqlalchemy.func.bernoulli(fraction * 100))
+        return ClauseAdapter(table).traverse(select), float(fraction)
+
+    raise ValueError('sample_column is required to sample the select')
+
+
+def _grouping_sets_select(select, grouping_sets, values, rollups=None):
+    '''
+    Get select aggregating values by every grouping set, first column is
+    the index of the grouping set, dimension columns not in the grouping
+    set are null.
+
+    GROUPING_SETS_DIALECTS group by GROUPING SETS in one pass over the
+    select, or by ROLLUP of every list of names in rollups when the
+    grouping sets are all combinations of their prefixes. Other databases
+    get union of selects grouped by each set.
+
+    :return: tuple (statement, names of dimension columns)
+    '''
+    dimensions = _make_unique(name for names in grouping_sets
+                              for name in names)
+
+    if _supports_grouping_sets(select.bind):
+        base = select.alias('pivot_base')
+        columns = _columns(base, dimensions)
+        if rollups is not None:
+            group_by = [sqlalchemy.func.rollup(*_columns(base, names))
+                        for names in rollups if names]
+        else:
+            group_by = [sqlalchemy.func.grouping_sets(*[
+                sqlalchemy.tuple_(*_columns(base, names))
+                for names in grouping_sets])]
+        statement = sqlalchemy.select(
+            [_grouping_id(columns, dimensions, grouping_sets)] +
+            [column.label(name) for column, name in zip(columns, dimensions)] +
+            [aggregate.label('value_%d' % j)
+             for j, aggregate in enumerate(_aggr_columns(base, values))]
+        ).group_by(*group_by)
+        return statement, dimensions
+
+    base = select.cte('pivot_base')
+    selects = []
+    for i, names in enumerate(grouping_sets):
+        columns = [sqlalchemy.literal_column('%d' % i).label('grouping_id')]
+        for name in dimensions:
+            column = _column(base, name)
+            if name not in names:
+                column = sqlalchemy.cast(sqlalchemy.null(), column.type)
+            columns.append(column.label(name))
+        columns += [aggregate.label('value_%d' % j)
+                    for j, aggregate in enumerate(_aggr_columns(base, values))]
+
+        selects.append(
+            sqlalchemy.select(columns).group_by(*_columns(base, names)))
+
+    return sqlalchemy.union_all(*selects), dimensions
+
+
+def _check_buckets(keys, name):
+    if any(isinstance(key, TimeBucket) for key in keys):
+        raise ValueError('Time buckets are not supported by %s' % name)
+
+
+def _supports_grouping_sets(bind):
+    return (bind is not None and
+            bind.dialect.name in GROUPING_SETS_DIALECTS and
+            hasattr(sqlalchemy.sql.functions, 'grouping_sets'))
+
+
+def _grouping_id(columns, dimensions, grouping_sets):
+    '''
+    Get expression of the index of the grouping set of a row grouped by
+    GROUPING SETS, from bits of GROUPING of the dimension columns.
+    '''
+    if not columns:
+        return sqlalchemy.literal_column('0').label('grouping_id')
+
+    bits = [sqlalchemy.func.grouping(column) *
+            sqlalchemy.literal_column('%d' % (1 << i))
+            for i, column in enumerate(reversed(columns))]
+    grouping = sum(bits[1:], bits[0])
+
+    whens = []
+    for i, names in enumerate(grouping_sets):
+        mask = sum(1 << j for j, name in enumerate(reversed(dimensions))
+                   if name not in names)
+        whens.append((grouping == sqlalchemy.literal_column('%d' % mask),
+                      sqlalchemy.literal_column('%d' % i)))
+    return sqlalchemy.case(whens).label('grouping_id')
+
+
+def _pivot_select(select, rows, cols, values, max_cols=None, top_by=None,
+                  other=OTHER_NAME, use_aggregates=True):
     rows = _sanitize_list(rows)
     cols = _sanitize_list(cols)
     values = _sanitize_list(values)
 
+    if max_cols is None and use_aggregates:
+        aggregate = aggregates.find(select, rows + cols,
+                                    list(map(_aggr_column_name, values)))
+        if aggregate is not None:
+            return _aggregate_pivot_select(aggregate, rows, cols, values)
+
+    if max_cols is not None and cols:
+        select = select.alias('pivot_base')
+
     rows_columns = _columns(select, rows)
     cols_columns = _columns(select, cols)
     values_columns = _aggr_columns(select, values)
 
+    if max_cols is not None and cols:
+        top = _top_cols_select(select, cols, top_by or values[0], max_cols)
+        matched = top.c[key_name(cols[0])] != None
+        cols_columns = [
+            sqlalchemy.case([(matched, column)], else_=other).label(name)
+            for name, column in zip(_key_names(cols), cols_columns)]
+        from_obj = sqlalchemy.outerjoin(select, top, sqlalchemy.and_(
+            *[_column(select, key) == top.c[key_name(key)] for key in cols]))
+    else:
+        from_obj = None
+
     group_columns = rows_columns + cols_columns
     columns = group_columns + values_columns
     pivot_select = sqlalchemy.select(columns).group_by(*group_columns)
+    if from_obj is not None:
+        pivot_select = pivot_select.select_from(from_obj)
+    return pivot_select
+
+
+def _aggregate_pivot_select(aggregate, rows, cols, values):
+    '''
+    Get pivot select merging partial aggregates of the aggregate table,
+    avg is sum of sums divided by sum of counts.
+    '''
+    select = aggregate.select
+    group_columns = _columns(select, rows + cols)
 
-    data = pivot_select.execute(bind=select.bind).fetchall()
-    return map(tuple, data)
+    values_columns = []
+    for value in values:
+        name, func_name = _aggr_column_name(value)
+        partials = [
+            _aggregate(_column(select, aggregate.measures[(partial, name)]),
+                       aggregates.MERGE[partial])
+            for partial in aggregates.PARTIALS[func_name]]
+        if len(partials) == 2:
+            total, count = partials
+            values_columns.append(sqlalchemy.cast(total, sqlalchemy.Float) /
+                                  sqlalchemy.func.nullif(count, 0))
+        else:
+            values_columns.append(partials[0])
+
+    return sqlalchemy.select(group_columns + values_columns).group_by(
+        *group_columns)
+
+
+def _top_cols_select(select, cols, top_by, max_cols):
+    name, func_name = _aggr_column_name(top_by)
+    cols_columns = _columns(select, cols)
+    score = _aggregate(_column(select, name), func_name)
+
+    return sqlalchemy.select(cols_columns).group_by(*cols_columns).order_by(
+        score.desc(), *cols_columns).limit(max_cols).alias('top_cols')
+
+
+def _compile_pivot_select(select, rows, cols, values, **options):
+    '''
+    Get pivot select, statements are cached by the select object, rows,
+    cols, values and options of _pivot_select.
+    '''
+    with stage('compile') as s:
+        try:
+            key = (select, _hashable(rows), _hashable(cols),
+                   _hashable(values), tuple(sorted(options.items())),
+                   aggregates.version())
+            pivot_select = _statements.get(key)
+        except TypeError:
+            key, pivot_select = None, None
+
+        if pivot_select is None:
+            pivot_select = _pivot_select(select, rows, cols, values,
+                                         **options)
+            if key is not None:
+                _statements[key] = pivot_select
+
+        if s:
+            s.set(sql=str(_compile(pivot_select, select.bind)))
+    return pivot_select
+
+
+def _compile(statement, bind):
+    key = (statement, bind.dialect if bind is not None else None)
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = _compiled[key] = statement.compile(bind=bind)
+    return compiled
+
+
+def _hashable(value):
+    if isinstance(value, list):
+        return tuple(value)
+    hash(value)
+    return value
+
+
+def _execute_result(statement, bind, params=None):
+    '''
+    Execute statement, bind shares a compiled cache, so statements from
+    _compile_pivot_select are compiled once per dialect.
+    '''
+    with stage('execute'):
+        bind = bind.execution_options(compiled_cache=_compiled_cache)
+        if params:
+            return bind.execute(statement, params)
+        return bind.execute(statement)
+
+
+def _execute(statement, bind, params=None):
+    result = _execute_result(statement, bind, params)
+
+    with stage('fetch') as s:
+        try:
+            data = list(map(tuple, result.fetchall()))
+        finally:
+            result.close()
+        s.set(rows=len(data))
+
+    return data
+
+
+def _pivot_frame(df, rows, cols, values, aggfunc):
+    with stage('reshape') as s:
+        pivot = df.pivot_table(rows=rows, cols=cols, values=values,
+                               aggfunc=aggfunc)
+        if s:
+            s.set(shape=pivot.shape, bytes=nbytes(pivot))
+    return pivot
+
+
+def _unstack(df, rows, cols, values):
+    '''
+    Reshape data with unique rows and cols keys, as returned by pivot_data,
+    into the same table as DataFrame.pivot_table returns.
+
+    No aggregation is done, keys are factorized and values are placed into
+    the table by the key codes. Like pivot_table of the installed pandas,
+    values are sorted and all NaN rows and columns dropped since pandas
+    0.14, older versions keep them and the order of values with cols.
+    '''
+    with stage('reshape') as s:
+        pivot = _unstack_frame(df, rows, cols, values)
+        if s:
+            s.set(shape=pivot.shape, bytes=nbytes(pivot))
+    return pivot
+
+
+def _unstack_frame(df, rows, cols, values):
+    rows = _sanitize_list(rows)
+    cols = _sanitize_list(cols)
+    # pandas < 0.14 sorts columns of the values level by their codes
+    values = list(values) if _LEGACY_PIVOT and cols else sorted(values)
+
+    df = _bucket_dates(df, rows + cols)
+    rows = _key_names(rows)
+    cols = _key_names(cols)
+    if not _LEGACY_PIVOT:
+        df = df.dropna(how='all', subset=values)
+    df = df.dropna(subset=rows + cols)
+    row_codes, row_index = _factorize(df, rows)
+    col_codes, col_index = _factorize(df, cols)
+
+    columns = _pivot_columns(values, cols, col_index)
+
+    blocks = []
+    for value in values:
+        array = df[value].values
+        dtype = array.dtype if array.dtype.kind in 'fc' else (
+            np.float64 if array.dtype.kind in 'iub' else object)
+        block = np.empty((len(row_index), len(col_index) or 1), dtype=dtype)
+        block.fill(np.nan)
+        block[row_codes, col_codes] = array
+        blocks.append(block)
+
+    pivot = pd.DataFrame(np.hstack(blocks), index=row_index, columns=columns)
+    if _LEGACY_PIVOT:
+        return pivot
+    return pivot.dropna(how='all', axis=1)
+
+
+def _pivot_columns(values, cols, col_index):
+    '''
+    Get columns of pivot table, every value is combined with every key of
+    col_index.
+    '''
+    if not cols:
+        return pd.Index(values)
+
+    return pd.MultiIndex.from_tuples(
+        [(value,) + (key if isinstance(key, tuple) else (key,))
+         for value in values for key in col_index],
+        names=[None] + cols)
+
+
+def _bucket_dates(df, keys):
+    '''
+    Get df with columns of time bucket keys converted to datetime64.
+    '''
+    names = [key.column for key in keys if isinstance(key, TimeBucket) and
+             df[key.column].dtype.kind != 'M']
+    if names:
+        df = df.copy()
+        for name in names:
+            df[name] = pd.to_datetime(df[name])
+    return df
+
+
+def _factorize(df, keys):
+    '''
+    Factorize keys columns of df without nulls.
+
+    :return: tuple (codes, index), index holds sorted unique keys and codes
+        are positions of df keys in it
+    '''
+    if not keys:
+        return np.zeros(len(df), dtype=np.intp), []
+
+    levels, level_codes = [], []
+    for key in keys:
+        codes, uniques = _factorize_column(df[key])
+        levels.append(uniques)
+        level_codes.append(codes)
+
+    if len(keys) == 1:
+        return level_codes[0], pd.Index(levels[0], name=keys[0])
+
+    group = np.zeros(len(df), dtype=np.int64)
+    for uniques, codes in zip(levels, level_codes):
+        group = group * len(uniques) + codes
+    codes, groups = pd.factorize(group, sort=True)
+
+    labels = []
+    for uniques in reversed(levels):
+        labels.insert(0, groups % len(uniques))
+        groups = groups // len(uniques)
+
+    return codes, _multi_index(levels, labels, keys)
+
+
+def _factorize_column(column):
+    '''
+    Codes of Categorical columns are used as they are, only categories
+    without any row are removed.
+    '''
+    if str(column.dtype) != 'category':
+        return pd.factorize(column.values, sort=True)
+
+    codes = column.cat.codes.values
+    categories = column.cat.categories
+    used = np.bincount(codes, minlength=len(categories)) > 0
+    if used.all():
+        return codes, categories
+
+    return (np.cumsum(used) - 1)[codes], categories[used]
+
+
+def _multi_index(levels, codes, names):
+    try:
+        return pd.MultiIndex(levels=levels, codes=codes, names=names)
+    except TypeError:
+        return pd.MultiIndex(levels=levels, labels=codes, names=names)
+
+
+def _data_frame(data, columns):
+    def _preprocess_row(row):
+        return [float(a) if isinstance(a, Decimal) else a for a in row]
+
+    with stage('convert') as s:
+        df = pd.DataFrame(list(map(_preprocess_row, data)), columns=columns)
+        if s:
+            s.set(rows=len(df), bytes=nbytes(df))
+    return df
+
+
+def _fetch_arrays(result, n_columns, chunk_size, convert=True,
+                  categorical=()):
+    '''
+    Fetch all rows of the result as one array per column, the result is
+    closed.
+
+    Columns of strings whose positions are in categorical are encoded into
+    Categorical chunk by chunk, against categories of the previous chunks.
+    Other columns are converted chunk by chunk too, chunks of different
+    types are promoted when concatenated, see _concatenate.
+
+    :param convert: convert columns of numbers, see _convert_array
+    :param categorical: positions of columns to encode
+    '''
+    chunks = [[] for _ in range(n_columns)]
+    categories = dict((i, None) for i in categorical)
+    try:
+        for arrays in _fetch_chunks(result, chunk_size):
+            for i, (chunk, array) in enumerate(zip(chunks, arrays)):
+                if categories.get(i, False) is None:
+                    categories[i] = _category_map(array, chunk)
+                if isinstance(categories.get(i), dict):
+                    array = _encode_chunk(array, categories[i])
+                elif convert:
+                    array = _convert_array(array)
+                chunk.append(array)
+    finally:
+        result.close()
+
+    arrays = []
+    for i, chunk in enumerate(chunks):
+        if isinstance(categories.get(i), dict):
+            arrays.append(_categorical(np.concatenate(chunk),
+                                       list(categories[i])))
+            continue
+
+        arrays.append(_concatenate(chunk))
+    return arrays
+
+
+def _concatenate(chunks):
+    '''
+    Concatenate converted chunks of a column. Int chunks are promoted to
+    float when there are float chunks or chunks of nulls, chunks of numbers
+    to objects when there are chunks of other values.
+    '''
+    if not chunks:
+        return np.empty(0, dtype=object)
+
+    objects = [chunk for chunk in chunks if chunk.dtype.kind == 'O']
+    if objects and len(objects) < len(chunks) and all(
+            pd.isnull(chunk).all() for chunk in objects):
+        chunks = [np.repeat(np.nan, len(chunk)) if chunk.dtype.kind == 'O'
+                  else chunk for chunk in chunks]
+    elif objects:
+        chunks = [chunk.astype(object) for chunk in chunks]
+    return np.concatenate(chunks)
+
+
+def _category_map(array, chunks):
+    '''
+    Get empty map of categories to codes when the first present value of
+    the array is a string, previous chunks of nulls are replaced by codes.
+
+    :return: OrderedDict, False for other values or None when all values
+        are null
+    '''
+    present = np.flatnonzero(~pd.isnull(array))
+    if not len(present):
+        return None
+    if not isinstance(array[present[0]], _string_types):
+        return False
+
+    chunks[:] = [np.repeat(np.int32(-1), len(chunk)) for chunk in chunks]
+    return collections.OrderedDict()
+
+
+def _encode_chunk(array, categories):
+    '''
+    Get codes of values of the array, new values are added to categories.
+    '''
+    codes, uniques = pd.factorize(array)
+    if not len(uniques):
+        return np.repeat(np.int32(-1), len(array))
+
+    mapping = np.array([categories.setdefault(value, len(categories))
+                        for value in uniques], dtype=np.int32)
+    return np.where(codes < 0, np.int32(-1), mapping[codes])
+
+
+def _categorical(codes, categories):
+    '''
+    Get Categorical of codes of categories, categories are sorted.
+    '''
+    categories = np.array(categories, dtype=object)
+    order = np.argsort(categories)
+    ranks = np.empty(len(order), dtype=codes.dtype)
+    ranks[order] = np.arange(len(order))
+    codes = np.where(codes < 0, codes, ranks[codes])
+    if not hasattr(pd.Categorical, 'from_codes'):
+        # pandas < 0.15
+        return pd.Categorical(codes, categories[order])
+    return pd.Categorical.from_codes(codes, categories[order])
+
+
+def _fetch_chunks(result, chunk_size):
+    if not result.returns_rows:
+        return
+
+    while True:
+        fetched = result.fetchmany(chunk_size)
+        if not fetched:
+            break
+        yield [np.array(column, dtype=object) for column in zip(*fetched)]
+
+
+def _fetch_frames(result, columns, chunk_size):
+    for arrays in _fetch_chunks(result, chunk_size):
+        arrays = list(map(_convert_array, arrays))
+        yield pd.DataFrame(collections.OrderedDict(zip(columns, arrays)),
+                           columns=columns)
+
+
+def _convert_array(array):
+    '''
+    Convert object array to float or int array when it holds numbers,
+    Decimals are converted to float. The type is inferred from all values,
+    an int array holds only ints and no nulls.
+    '''
+    mask = pd.isnull(array)
+    present = np.flatnonzero(~mask)
+    if not len(present):
+        return array
+
+    first = array[present[0]]
+    if isinstance(first, bool) or not isinstance(first, numbers.Number):
+        return array
+
+    values = array[present]
+    inferred = np.array(values.tolist())
+
+    if inferred.dtype.kind in 'iu' and not mask.any():
+        return inferred.astype(np.int64)
+
+    if inferred.dtype.kind in 'iuf' or inferred.dtype.kind == 'O' and all(
+            isinstance(a, numbers.Number) for a in values):
+        converted = np.empty(len(array), dtype=np.float64)
+        converted[present] = values.astype(np.float64)
+        converted[mask] = np.nan
+        return converted
+
+    return array
 
 
 def _sanitize_list(wannabe_list):
@@ -80,11 +1304,14 @@ def _sanitize_list(wannabe_list):
 
 
 def _column(select, column_name):
+    if isinstance(column_name, TimeBucket):
+        column = truncate(select.c[column_name.column], column_name.grain)
+        return column.label(column_name.column)
     return select.c[column_name]
 
 
 def _columns(select, column_names):
-    return map(partial(_column, select), column_names)
+    return list(map(partial(_column, select), column_names))
 
 
 def _aggr_column_name(name):
@@ -104,24 +1331,41 @@ def _sql_aggregate_function(func_name):
     return getattr(sqlalchemy.func, func_name)
 
 
+def _aggregate(column, func_name, condition=None):
+    '''
+    Aggregate column, only rows matching condition are aggregated when it is
+    given. Conditional count is null when no row matches, like other
+    aggregates.
+    '''
+    if condition is not None:
+        if func_name in ('count', len):
+            condition = sqlalchemy.and_(condition, column != None)
+            return sqlalchemy.func.sum(sqlalchemy.case([(condition, 1)]))
+        argument = sqlalchemy.case([(condition, column)])
+    else:
+        argument = column
+
+    func = _sql_aggregate_function(func_name)
+    aggregate = func(argument)
+
+    if isinstance(column.type, sqlalchemy.Numeric):
+        aggregate = sqlalchemy.cast(aggregate, sqlalchemy.Float)
+
+    return aggregate
+
+
 def _aggr_columns(select, column_names):
     def _aggr_column(name):
         name, func_name = _aggr_column_name(name)
 
         column = _column(select, name)
-        func = _sql_aggregate_function(func_name)
-        aggregate = func(column)
-
-        if isinstance(column.type, sqlalchemy.Numeric):
-            aggregate = sqlalchemy.cast(aggregate, sqlalchemy.Float)
+        return _aggregate(column, func_name)
 
-        return aggregate
-
-    return map(_aggr_column, column_names)
+    return list(map(_aggr_column, column_names))
 
 
 def _aggr_column_names(values):
-    functions = map(_aggr_column_name, _sanitize_list(values))
+    functions = list(map(_aggr_column_name, _sanitize_list(values)))
 
     d = collections.defaultdict(list)
     for name, func_name in functions:
@@ -141,12 +1385,16 @@ def _aggr_column_names(values):
 
 
 def _column_names(rows, cols, values):
-    rows = _sanitize_list(rows)
-    cols = _sanitize_list(cols)
+    rows = _key_names(_sanitize_list(rows))
+    cols = _key_names(_sanitize_list(cols))
     values = _sanitize_list(values)
     return rows + cols + values
 
 
+def _key_names(keys):
+    return list(map(key_name, keys))
+
+
 def _make_unique(seq):
     seen = set()
     seen_add = seen.add
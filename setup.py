@@ -6,7 +6,7 @@ setup(
     name='pandas-sqlalchemy-pivot',
     version='0.1',
     packages=find_packages(
-        exclude=["*.tests", "*.tests.*", "tests.*", "tests"]
+        exclude=["*.tests", "*.tests.*", "tests.*", "tests", "benchmarks"]
     ),
     py_modules=[],
     url='',
@@ -15,4 +15,8 @@ setup(
     author_email='tomas@drencak.com',
     description='',
     install_requires=['pandas', 'numpy', 'sqlalchemy'],
+    extras_require={
+        'arrow': ['pyarrow'],
+        'sparse': ['scipy'],
+    },
 )
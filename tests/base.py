@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+import sqlalchemy
+
+
+class TableTestCase(TestCase):
+    '''
+    Test case with mytable of columns in sqlite database, rows of data are
+    inserted in setUp.
+
+    The database is in file when file_database is True, partitions are read
+    by threads, which do not share sqlite://.
+    '''
+    columns = [
+        ('yearmonth', sqlalchemy.String(50)),
+        ('gender', sqlalchemy.String(50)),
+        ('price', sqlalchemy.Numeric),
+    ]
+    data = []
+    file_database = False
+
+    def setUp(self):
+        if self.file_database:
+            self.database_directory = tempfile.mkdtemp()
+            url = 'sqlite:///%s' % os.path.join(self.database_directory,
+                                                'pivot.db')
+        else:
+            url = 'sqlite://'
+        self.engine = sqlalchemy.create_engine(url, echo=False)
+        self.metadata = sqlalchemy.MetaData(bind=self.engine)
+
+        self.mytable = sqlalchemy.Table('mytable', self.metadata,
+                                        *self._columns())
+        self.metadata.create_all(bind=self.engine, checkfirst=False)
+
+        for row in self.data:
+            self._insert_data(*row)
+
+    def tearDown(self):
+        self.engine.dispose()
+        if self.file_database:
+            shutil.rmtree(self.database_directory)
+
+    def _columns(self):
+        return [sqlalchemy.Column(name, type_) for name, type_ in self.columns]
+
+    def _insert_data(self, *row):
+        '''
+        Insert row of values in order of columns.
+        '''
+        self.mytable.insert().execute(
+            **dict(zip([name for name, _ in self.columns], row)))
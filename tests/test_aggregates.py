@@ -0,0 +1,162 @@
+import sqlalchemy
+import pivots
+from pivots import aggregates, instrument
+from base import TableTestCase
+
+
+class AggregatesTest(TableTestCase):
+    columns = [
+        ('yearmonth', sqlalchemy.String(50)),
+        ('gender', sqlalchemy.String(50)),
+        ('town', sqlalchemy.String(50)),
+        ('price', sqlalchemy.Integer),
+    ]
+    data = [('201001', 'male', 'BA', 10), ('201001', 'male', 'BA', 5),
+            ('201001', 'male', 'KE', 1), ('201001', 'female', 'KE', 10),
+            ('201002', 'female', 'KE', 3)]
+    file_database = True
+
+    def setUp(self):
+        super(AggregatesTest, self).setUp()
+        self.by_town = sqlalchemy.Table(
+            'by_town', self.metadata,
+            sqlalchemy.Column('yearmonth', sqlalchemy.String(50)),
+            sqlalchemy.Column('gender', sqlalchemy.String(50)),
+            sqlalchemy.Column('town', sqlalchemy.String(50)),
+            sqlalchemy.Column('price_sum', sqlalchemy.Integer),
+            sqlalchemy.Column('price_count', sqlalchemy.Integer),
+        )
+        self.by_month = sqlalchemy.Table(
+            'by_month', self.metadata,
+            sqlalchemy.Column('yearmonth', sqlalchemy.String(50)),
+            sqlalchemy.Column('gender', sqlalchemy.String(50)),
+            sqlalchemy.Column('price_sum', sqlalchemy.Integer),
+        )
+        self.metadata.create_all(bind=self.engine,
+                                 tables=[self.by_town, self.by_month])
+
+        t = self.mytable.c
+        self.engine.execute(self.by_town.insert().from_select(
+            ['yearmonth', 'gender', 'town', 'price_sum', 'price_count'],
+            sqlalchemy.select([t.yearmonth, t.gender, t.town,
+                               sqlalchemy.func.sum(t.price),
+                               sqlalchemy.func.count(t.price)]).group_by(
+                t.yearmonth, t.gender, t.town)))
+        self.engine.execute(self.by_month.insert().from_select(
+            ['yearmonth', 'gender', 'price_sum'],
+            sqlalchemy.select([t.yearmonth, t.gender,
+                               sqlalchemy.func.sum(t.price)]).group_by(
+                t.yearmonth, t.gender)))
+
+        self.select = self.mytable.select()
+        aggregates.register(
+            self.select, self.by_town.select(),
+            dimensions=['yearmonth', 'gender', 'town'],
+            measures={('sum', 'price'): 'price_sum',
+                      ('count', 'price'): 'price_count'})
+        aggregates.register(
+            self.select, self.by_month.select(),
+            dimensions=['yearmonth', 'gender'],
+            measures={('sum', 'price'): 'price_sum'})
+
+    def tearDown(self):
+        aggregates.unregister(self.select)
+        super(AggregatesTest, self).tearDown()
+
+    def _pivot(self, select, rows, cols, values):
+        with instrument.collect() as events:
+            table = pivots.pivot_table_from_select(select, rows, cols, values)
+        [compiled] = [event for event in events if event['stage'] == 'compile']
+        return table, compiled['sql']
+
+    def _expected(self, rows, cols, values):
+        select = self.mytable.select().where(self.mytable.c.price != None)
+        return pivots.pivot_table_from_select(select, rows, cols, values)
+
+    def test_smallest(self):
+        table, sql = self._pivot(self.select, 'yearmonth', 'gender', 'price')
+
+        self.assertTrue('by_month' in sql)
+        self.assertEquals(str(self._expected('yearmonth', 'gender', 'price')),
+                          str(table))
+
+    def test_avg(self):
+        values = ['price', ('avg', 'price'), ('count', 'price')]
+        table, sql = self._pivot(self.select, 'town', 'gender', values)
+
+        self.assertTrue('by_town' in sql)
+        self.assertEquals(str(self._expected('town', 'gender', values)),
+                          str(table))
+
+    def test_not_covered(self):
+        table, sql = self._pivot(self.select, 'yearmonth', 'gender',
+                                 ('max', 'price'))
+
+        self.assertTrue('by_' not in sql)
+        self.assertEquals(
+            str(self._expected('yearmonth', 'gender', ('max', 'price'))),
+            str(table))
+
+    def test_unregister(self):
+        aggregates.unregister(self.select)
+
+        table, sql = self._pivot(self.select, 'yearmonth', 'gender', 'price')
+
+        self.assertTrue('by_' not in sql)
+
+    def test_equal_select(self):
+        select = self.mytable.select().order_by('town')
+        table, sql = self._pivot(select, 'yearmonth', 'gender', 'price')
+
+        self.assertTrue('by_month' in sql)
+
+        select = self.mytable.select().where(self.mytable.c.town == 'BA')
+        table, sql = self._pivot(select, 'yearmonth', 'gender', 'price')
+
+        self.assertTrue('by_' not in sql)
+        self.assertEquals(15, table.price.male['201001'])
+
+    def test_params(self):
+        select = self.mytable.select().where(
+            self.mytable.c.town == sqlalchemy.bindparam('town'))
+        self.assertRaises(ValueError, aggregates.register, select,
+                          self.by_month.select(), ['yearmonth', 'gender'],
+                          {('sum', 'price'): 'price_sum'})
+
+        table = pivots.pivot_table_from_select(
+            select, 'yearmonth', 'gender', 'price', params={'town': 'BA'})
+        self.assertEquals([[15]], table.values.tolist())
+
+        select = self.mytable.select().where(self.mytable.c.town == 'BA')
+        aggregates.register(select, self.by_month.select(),
+                            ['yearmonth', 'gender'],
+                            {('sum', 'price'): 'price_sum'})
+        try:
+            table = pivots.pivot_table_from_select(
+                select, 'yearmonth', 'gender', 'price',
+                params={'town_1': 'KE'})
+        finally:
+            aggregates.unregister(select)
+        self.assertEquals([[10, 1], [3, 0]], table.fillna(0).values.tolist())
+
+    def test_materialized(self):
+        pivot = pivots.MaterializedPivot(self.select, 'yearmonth', 'gender',
+                                         'price', watermark='price')
+
+        self.assertEquals(str(self._expected('yearmonth', 'gender', 'price')),
+                          str(pivot.refresh()))
+
+    def test_partitioned(self):
+        partition = sqlalchemy.cast(self.select.c.yearmonth,
+                                    sqlalchemy.Integer)
+        table = pivots.pivot_table_from_select(
+            self.select, 'yearmonth', 'gender', 'price', partition=partition,
+            partitions=2)
+
+        self.assertEquals(str(self._expected('yearmonth', 'gender', 'price')),
+                          str(table))
+
+    def test_size(self):
+        self.assertEquals(
+            [4, 3], [a.size for a in
+                     aggregates._aggregates[aggregates._key(self.select)]])
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, skipIf
+import sqlalchemy
+
+try:
+    import asyncio
+    import aiosqlite
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from pivots import aio
+except (ImportError, SyntaxError):
+    aio = None
+
+
+@skipIf(aio is None, 'requires asyncio, aiosqlite and sqlalchemy.ext.asyncio')
+class AsyncPivotTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.url = 'sqlite:///%s' % os.path.join(self.directory, 'pivot.db')
+
+        engine = sqlalchemy.create_engine(self.url)
+        metadata = sqlalchemy.MetaData()
+        self.mytable = sqlalchemy.Table(
+            'mytable', metadata,
+            sqlalchemy.Column('yearmonth', sqlalchemy.String(50)),
+            sqlalchemy.Column('gender', sqlalchemy.String(50)),
+            sqlalchemy.Column('price', sqlalchemy.Numeric),
+        )
+        metadata.create_all(bind=engine)
+        with engine.begin() as connection:
+            connection.execute(self.mytable.insert(), [
+                {'yearmonth': '201001', 'gender': 'male', 'price': 10},
+                {'yearmonth': '201001', 'gender': 'male', 'price': 5},
+                {'yearmonth': '201001', 'gender': 'female', 'price': 10},
+            ])
+        engine.dispose()
+
+        self.engine = create_async_engine(
+            self.url.replace('sqlite://', 'sqlite+aiosqlite://'))
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.engine.dispose())
+        self.loop.close()
+        shutil.rmtree(self.directory)
+
+    def test_pivot_data(self):
+        select = self.mytable.select().order_by('yearmonth', 'gender')
+        data = self.loop.run_until_complete(aio.pivot_data(
+            self.engine, select,
+            rows='yearmonth', cols='gender', values='price'
+        ))
+
+        self.assertEqual([(u'201001', u'female', 10),
+                          (u'201001', u'male', 15)], data)
+
+    def test_pivot_table(self):
+        table = self.loop.run_until_complete(aio.pivot_table_from_select(
+            self.engine, self.mytable.select(),
+            rows='yearmonth', cols='gender', values=('avg', 'price')
+        ))
+
+        self.assertEqual(10, table.price.female['201001'])
+        self.assertEqual(7.5, table.price.male['201001'])
+
+        chart = self.loop.run_until_complete(aio.get_chart(
+            table, 'yearmonth', 'gender', 'price', {}))
+        self.assertEqual(['201001'], chart['xAxis']['categories'])
+
+    def test_pivot_data_connection(self):
+        connection = self.engine.connect()
+        self.loop.run_until_complete(connection.start())
+        try:
+            data = self.loop.run_until_complete(aio.pivot_data(
+                connection, self.mytable.select(),
+                rows='yearmonth', cols=[], values='price'
+            ))
+        finally:
+            self.loop.run_until_complete(connection.close())
+
+        self.assertEqual([(u'201001', 25)], data)
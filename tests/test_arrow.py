@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+from unittest import skipIf
+import pivots
+from base import TableTestCase
+
+try:
+    from pivots import arrow
+except ImportError:
+    arrow = None
+
+
+@skipIf(arrow is None, 'requires pyarrow')
+class ArrowPivotTest(TableTestCase):
+    def setUp(self):
+        super(ArrowPivotTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(ArrowPivotTest, self).tearDown()
+
+    def test_pivot_data(self):
+        self._insert_data('201001', 'male', 10)
+        self._insert_data('201001', 'male', 5)
+        self._insert_data('201001', 'female', 10)
+
+        data = arrow.pivot_data_arrow(
+            self.mytable.select(), 'yearmonth', 'gender', 'price',
+            chunk_size=1)
+
+        self.assertEquals(['yearmonth', 'gender', 'price'],
+                          data.column_names)
+        self.assertEquals(2, data.num_rows)
+        self.assertEquals('double', str(data.schema.field('price').type))
+
+    def test_pivot_table(self):
+        self._insert_data('201001', 'male', 10)
+        self._insert_data('201001', 'male', 5)
+        self._insert_data('201001', 'female', 10)
+
+        select = self.mytable.select()
+        table = arrow.pivot_table_arrow(select, 'yearmonth', 'gender',
+                                        ('avg', 'price'))
+        expected = pivots.pivot_table_from_select(select, 'yearmonth',
+                                                  'gender', ('avg', 'price'))
+
+        self.assertEquals(str(expected), str(table))
+
+    def test_empty(self):
+        table = arrow.pivot_table_arrow(self.mytable.select(), 'yearmonth',
+                                        'gender', 'price')
+
+        self.assertIsNone(table)
+
+    def test_write(self):
+        self._insert_data('201001', 'male', 10)
+        self._insert_data('201002', 'female', 10)
+        table = pivots.pivot_table_from_select(
+            self.mytable.select(), 'yearmonth', 'gender', 'price')
+
+        for format in ['ipc', 'parquet']:
+            path = os.path.join(self.directory, 'pivot.' + format)
+            arrow.write_pivot(table, path, format=format)
+
+            self.assertEquals(str(table), str(arrow.read_pivot(path, format)))
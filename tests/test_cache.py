@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+import sqlalchemy
+import pivots
+from pivots.cache import MemoryCache, DiskCache, statement_key
+from base import TableTestCase
+
+
+class MemoryCacheTest(TestCase):
+    def test_lru(self):
+        cache = MemoryCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEquals(1, cache.get('a'))
+
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEquals(1, cache.get('a'))
+        self.assertEquals(3, cache.get('c'))
+        self.assertEquals({'hits': 3, 'misses': 1, 'evictions': 1, 'size': 2},
+                          cache.stats())
+
+    def test_ttl(self):
+        cache = MemoryCache(ttl=-1)
+        cache.set('a', 1)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEquals(1, cache.evictions)
+
+    def test_invalidate(self):
+        cache = MemoryCache()
+        cache.set('a', 1, tables=['mytable'])
+        cache.set('b', 2, tables=['other'])
+
+        cache.invalidate(tables=['mytable'])
+        self.assertIsNone(cache.get('a'))
+        self.assertEquals(2, cache.get('b'))
+
+        cache.invalidate()
+        self.assertIsNone(cache.get('b'))
+
+
+class DiskCacheTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_shared(self):
+        DiskCache(self.directory).set('a', [(u'201001', 10.0)], ['mytable'])
+
+        cache = DiskCache(self.directory)
+        self.assertEquals([(u'201001', 10.0)], cache.get('a'))
+        self.assertEquals(1, len(cache))
+
+        cache.invalidate(tables=['other'])
+        self.assertEquals(1, len(cache))
+
+        cache.invalidate(tables=['mytable'])
+        self.assertIsNone(cache.get('a'))
+
+    def test_failed_write(self):
+        cache = DiskCache(self.directory)
+
+        self.assertRaises(Exception, cache.set, 'a', lambda: None)
+        self.assertEquals([], os.listdir(self.directory))
+
+
+class PivotCacheTest(TableTestCase):
+    def test_pivot_data(self):
+        cache = MemoryCache()
+        self._insert_data('201001', 'male', 10)
+
+        select = self.mytable.select()
+        data = pivots.pivot_data(select, 'yearmonth', 'gender', 'price',
+                                 cache=cache)
+        self._insert_data('201001', 'male', 5)
+        cached = pivots.pivot_data(select, 'yearmonth', 'gender', 'price',
+                                   cache=cache)
+
+        self.assertEquals([(u'201001', u'male', 10)], data)
+        self.assertEquals(data, cached)
+        self.assertEquals(1, cache.hits)
+
+        cache.invalidate(tables=['mytable'])
+        data = pivots.pivot_data(select, 'yearmonth', 'gender', 'price',
+                                 cache=cache)
+        self.assertEquals([(u'201001', u'male', 15)], data)
+
+    def test_parameters(self):
+        cache = MemoryCache()
+        self._insert_data('201001', 'male', 10)
+        self._insert_data('201001', 'female', 5)
+
+        def _data(gender):
+            select = self.mytable.select().where(
+                self.mytable.c.gender == gender)
+            return pivots.pivot_data(select, 'yearmonth', 'gender', 'price',
+                                     cache=cache)
+
+        self.assertEquals([(u'201001', u'male', 10)], _data('male'))
+        self.assertEquals([(u'201001', u'female', 5)], _data('female'))
+        self.assertEquals(0, cache.hits)
+
+    def test_databases(self):
+        other = sqlalchemy.create_engine('sqlite:///:memory:', echo=False)
+        select = self.mytable.select()
+
+        self.assertNotEqual(statement_key(select, self.engine),
+                            statement_key(select, other))
+        self.assertEquals(statement_key(select, self.engine),
+                          statement_key(select, self.engine.connect()))
@@ -1,7 +1,13 @@
 from datetime import datetime, date
+import json
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 from unittest import TestCase
 import pandas as pd
-from pivots.highcharts import get_axes, get_series
+from pivots.highcharts import get_axes, get_series, get_chart, \
+    iter_chart_json, write_chart
 from pivots.millis import unix_time_millis
 
 
@@ -160,3 +166,67 @@ class HighchartsPivotTest(TestCase):
                                     {'count': 'spline', 'price': 'line'})
         self.assertEquals('line', price.get('type'))
         self.assertEquals('spline', count.get('type'))
+
+    def test_series_time(self):
+        times = [datetime(1969, 12, 31, 23, 59, 59, 999999),
+                 datetime(2010, 1, 1, 12, 30, 15, 123456)]
+        pivot = pd.DataFrame({'price': [1.5, float('nan')]},
+                             index=pd.DatetimeIndex(times))
+
+        [price] = get_series(pivot, [])
+        self.assertEquals([(unix_time_millis(times[0]), 1.5),
+                           (unix_time_millis(times[1]), 0)],
+                          price['data'])
+        self.assertIsInstance(price['data'][1][1], int)
+        self.assertEquals(unix_time_millis(date(2010, 1, 1)),
+                          price['data'][1][0])
+
+    def test_chart_json(self):
+        pivot = pd.pivot_table(self.df, rows='month', cols='gender',
+                               values=['price', 'count'])
+
+        chart = get_chart(pivot, 'month', 'gender', ['price', 'count'],
+                          {'price': 'line'})
+        fp = StringIO()
+        write_chart(pivot, 'month', 'gender', ['price', 'count'],
+                    {'price': 'line'}, fp, chunk_size=1)
+
+        self.assertEquals(json.loads(json.dumps(chart)),
+                          json.loads(fp.getvalue()))
+
+    def test_chart_json_categories(self):
+        pivot = pd.pivot_table(self.df, rows='gender', cols='town',
+                               values='price')
+
+        chart = get_chart(pivot, 'gender', 'town', 'price', {})
+        data = ''.join(iter_chart_json(pivot, 'gender', 'town', 'price', {}))
+
+        self.assertEquals(json.loads(json.dumps(chart)), json.loads(data))
+
+    def test_max_points(self):
+        index = pd.date_range('2010-01-01', periods=100, freq='D')
+        pivot = pd.DataFrame({'price': [float(i % 10) for i in range(100)],
+                              'count': [1.0] * 99 + [float('nan')]},
+                             index=index, columns=['price', 'count'])
+
+        [price, count] = get_series(pivot, [], max_points=20)
+
+        self.assertTrue(len(price['data']) <= 20)
+        self.assertEquals(sorted(price['data']), price['data'])
+        self.assertEquals(set([0.0, 9.0]), set(y for x, y in price['data']))
+        self.assertEquals(0, count['data'][-1][1])
+
+        self.assertEquals(100, len(get_series(pivot, [])[0]['data']))
+        self.assertEquals(
+            100, len(get_series(pivot, [], max_points=100)[0]['data']))
+
+    def test_max_points_json(self):
+        index = pd.date_range('2010-01-01', periods=50, freq='H')
+        pivot = pd.DataFrame({'price': range(50)}, index=index)
+
+        chart = get_chart(pivot, 'hour', [], 'price', {}, max_points=10)
+        data = ''.join(iter_chart_json(pivot, 'hour', [], 'price', {},
+                                       chunk_size=3, max_points=10))
+
+        self.assertTrue(len(chart['series'][0]['data']) <= 10)
+        self.assertEquals(json.loads(json.dumps(chart)), json.loads(data))
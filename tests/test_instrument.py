@@ -0,0 +1,76 @@
+import threading
+import pivots
+from pivots import instrument
+from base import TableTestCase
+
+
+class InstrumentTest(TableTestCase):
+    data = [('201001', 'male', 10), ('201001', 'male', 5),
+            ('201001', 'female', 10)]
+
+    def test_collect(self):
+        with instrument.collect() as events:
+            table = pivots.pivot_table_from_select(
+                self.mytable.select(),
+                rows='yearmonth', cols='gender', values='price'
+            )
+            pivots.get_chart(table, 'yearmonth', 'gender', 'price', {})
+
+        self.assertEquals(
+            ['compile', 'execute', 'fetch', 'convert', 'reshape', 'serialize'],
+            [event['stage'] for event in events])
+
+        compile, execute, fetch, convert, reshape, serialize = events
+        self.assertIn('GROUP BY', compile['sql'])
+        self.assertEquals(2, fetch['rows'])
+        self.assertEquals(2, convert['rows'])
+        self.assertEquals((1, 2), reshape['shape'])
+        self.assertTrue(reshape['bytes'] > 0)
+        self.assertEquals((1, 2), serialize['shape'])
+        for event in events:
+            self.assertTrue(event['duration'] >= 0)
+
+        self.assertEquals([], instrument._listeners)
+        self.assertEquals([], instrument._collectors())
+
+    def test_collect_thread(self):
+        def _pivot():
+            with instrument.stage('fetch'):
+                pass
+
+        with instrument.collect() as events:
+            thread = threading.Thread(target=_pivot)
+            thread.start()
+            thread.join()
+
+        self.assertEquals([], events)
+
+    def test_chart_json(self):
+        table = pivots.pivot_table_from_select(
+            self.mytable.select(),
+            rows='yearmonth', cols='gender', values='price'
+        )
+        with instrument.collect() as events:
+            ''.join(pivots.iter_chart_json(table, 'yearmonth', 'gender',
+                                           'price', {}))
+
+        self.assertEquals(['serialize'], [event['stage'] for event in events])
+        self.assertEquals((1, 2), events[0]['shape'])
+
+    def test_error(self):
+        events = []
+        instrument.subscribe(events.append)
+        try:
+            self.assertRaises(Exception, pivots.pivot_data,
+                              self.mytable.select(), 'yearmonth', 'gender',
+                              ('nonexistent_function', 'price'))
+        finally:
+            instrument.unsubscribe(events.append)
+
+        self.assertEquals('execute', events[-1]['stage'])
+        self.assertIn('error', events[-1])
+
+    def test_disabled(self):
+        with instrument.stage('execute') as s:
+            self.assertFalse(s)
+            s.set(rows=1)
@@ -0,0 +1,66 @@
+import sqlalchemy
+import pivots
+from pivots import instrument
+from base import TableTestCase
+
+
+class MaterializedPivotTest(TableTestCase):
+    columns = [
+        ('yearmonth', sqlalchemy.String(50)),
+        ('gender', sqlalchemy.String(50)),
+        ('price', sqlalchemy.Integer),
+    ]
+
+    def setUp(self):
+        super(MaterializedPivotTest, self).setUp()
+        self.values = ['price', ('avg', 'price'), ('max', 'price')]
+        self.pivot = pivots.MaterializedPivot(
+            self.mytable.select(), rows='yearmonth', cols='gender',
+            values=self.values, watermark='id')
+
+    def _columns(self):
+        return [sqlalchemy.Column('id', sqlalchemy.Integer,
+                                  primary_key=True)] + \
+            super(MaterializedPivotTest, self)._columns()
+
+    def _expected(self):
+        return pivots.pivot_table_from_select(
+            self.mytable.select(), 'yearmonth', 'gender', self.values)
+
+    def test_empty(self):
+        self.assertEquals(None, self.pivot.refresh())
+        self.assertEquals(None, self.pivot.watermark)
+
+    def test_refresh(self):
+        self._insert_data('201001', 'male', 10)
+        self._insert_data('201001', 'female', 4)
+
+        self.assertEquals(str(self._expected()), str(self.pivot.refresh()))
+        self.assertEquals(2, self.pivot.watermark)
+
+        self._insert_data('201001', 'male', 5)
+        self._insert_data('201002', 'female', 2)
+
+        with instrument.collect() as events:
+            table = self.pivot.refresh()
+
+        [fetch] = [event for event in events if event['stage'] == 'fetch']
+        self.assertEquals(2, fetch['rows'])
+        self.assertEquals(4, self.pivot.watermark)
+        self.assertEquals(str(self._expected()), str(table))
+
+    def test_no_new_rows(self):
+        self._insert_data('201001', 'male', 10)
+        self.pivot.refresh()
+
+        with instrument.collect() as events:
+            table = self.pivot.refresh()
+
+        self.assertEquals([], [event for event in events
+                               if event['stage'] == 'fetch'])
+        self.assertEquals(str(self._expected()), str(table))
+
+    def test_not_reaggregable(self):
+        self.assertRaises(ValueError, pivots.MaterializedPivot,
+                          self.mytable.select(), 'yearmonth', 'gender',
+                          ('stddev', 'price'), 'id')
@@ -1,23 +1,26 @@
+from datetime import datetime
 from decimal import Decimal
-from unittest import TestCase
+from unittest import TestCase, skipIf
+import pandas as pd
 import sqlalchemy
+from sqlalchemy.dialects import mssql, mysql, oracle, postgresql
 import pivots
-
-
-class PivotTest(TestCase):
-    def setUp(self):
-        self.engine = sqlalchemy.create_engine('sqlite://', echo=False)
-        self.metadata = sqlalchemy.MetaData(bind=self.engine)
-
-        self.mytable = sqlalchemy.Table(
-            'mytable', self.metadata,
-            sqlalchemy.Column('customer_id', sqlalchemy.Integer),
-            sqlalchemy.Column('yearmonth', sqlalchemy.String(50)),
-            sqlalchemy.Column('gender', sqlalchemy.String(50)),
-            sqlalchemy.Column('town', sqlalchemy.String(50)),
-            sqlalchemy.Column('price', sqlalchemy.Numeric),
-        )
-        self.metadata.create_all(bind=self.engine, checkfirst=False)
+from pivots import instrument
+from pivots import table as table_module
+from pivots.buckets import TimeBucket
+from pivots.table import _LEGACY_PIVOT, _compile_pivot_select, \
+    _pivot_frame, _unstack
+from base import TableTestCase
+
+
+class PivotTestCase(TableTestCase):
+    columns = [
+        ('customer_id', sqlalchemy.Integer),
+        ('yearmonth', sqlalchemy.String(50)),
+        ('gender', sqlalchemy.String(50)),
+        ('town', sqlalchemy.String(50)),
+        ('price', sqlalchemy.Numeric),
+    ]
 
     def _insert_data(self, customer_id, yearmonth, gender, price, town=None):
         self.mytable.insert().execute(
@@ -28,6 +31,8 @@ class PivotTest(TestCase):
             town=town
         )
 
+
+class PivotTest(PivotTestCase):
     def test_pivot_data(self):
         self._insert_data(1, '201001', 'male', 10)
         self._insert_data(2, '201001', 'male', 5)
@@ -182,3 +187,675 @@ class PivotTest(TestCase):
 
         self.assertEquals(7.5, table.male['201001'])
         self.assertEquals(10, table.female['201001'])
+
+    @skipIf(not hasattr(pd.Categorical, 'from_codes'),
+            'requires pandas 0.15')
+    def test_pivot_data_frame(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201001', 'male', 5)
+        self._insert_data(3, '201001', 'female', 10)
+
+        select = self.mytable.select().order_by('yearmonth', 'gender')
+        df = pivots.pivot_data_frame(
+            select,
+            rows='yearmonth', cols='gender', values='price', chunk_size=1
+        )
+
+        self.assertEquals(['yearmonth', 'gender', 'price'], list(df.columns))
+        self.assertEquals([u'201001', u'201001'], list(df.yearmonth))
+        self.assertEquals([u'female', u'male'], list(df.gender))
+        self.assertEquals('category', df.gender.dtype.name)
+        self.assertEquals('float64', df.price.dtype.name)
+        self.assertEquals([10, 15], list(df.price))
+
+    @skipIf(not hasattr(pd.Categorical, 'from_codes'),
+            'requires pandas 0.15')
+    def test_pivot_data_frame_chunks(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201001', None, 5)
+        self._insert_data(3, '201002', 'female', 10)
+
+        for order in [self.mytable.c.gender, self.mytable.c.gender.desc()]:
+            select = self.mytable.select().order_by(order)
+            df = pivots.pivot_data_frame(
+                select,
+                rows='gender', cols='yearmonth', values='price', chunk_size=1
+            )
+
+            self.assertEquals('category', df.gender.dtype.name)
+            self.assertEquals([u'female', u'male'],
+                              list(df.gender.cat.categories))
+            self.assertEquals(
+                {None: 5, u'female': 10, u'male': 10},
+                dict((None if pd.isnull(gender) else gender, price)
+                     for gender, price in zip(df.gender.astype(object),
+                                              df.price)))
+
+    def test_pivot_data_frame_mixed_numbers(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2.5, '201001', 'male', 5)
+
+        select = self.mytable.select().order_by('customer_id')
+        df = pivots.pivot_data_frame(
+            select,
+            rows='customer_id', cols='gender', values='price'
+        )
+
+        self.assertEquals('float64', df.customer_id.dtype.name)
+        self.assertEquals([1, 2.5], list(df.customer_id))
+
+    def test_pivot_data_frame_chunk_types(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201001', 'male', 5)
+
+        select = self.mytable.select().order_by('customer_id')
+        df = pivots.pivot_data_frame(select, 'customer_id', 'gender', 'price',
+                                     chunk_size=1)
+
+        self.assertEquals('int64', df.customer_id.dtype.name)
+        self.assertEquals([1, 2], list(df.customer_id))
+
+        self._insert_data(None, '201001', 'male', 3)
+        self._insert_data(2.5, '201001', 'male', 4)
+        df = pivots.pivot_data_frame(select, 'customer_id', 'gender', 'price',
+                                     chunk_size=1)
+
+        self.assertEquals('float64', df.customer_id.dtype.name)
+        self.assertEquals([1, 2, 2.5], list(df.customer_id[1:]))
+        self.assertTrue(pd.isnull(df.customer_id[0]))
+
+    def test_columnar(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201001', 'male', 5)
+        self._insert_data(3, '201001', 'female', 10)
+
+        table = pivots.pivot_table_from_select(
+            self.mytable.select(),
+            rows='yearmonth', cols='gender', values=('avg', 'price'),
+            columnar=True
+        )
+
+        self.assertEquals(10, table.price.female['201001'])
+        self.assertEquals(7.5, table.price.male['201001'])
+
+    def test_columnar_categorical(self):
+        self._insert_data(1, '201001', 'male', 10, town='BA')
+        self._insert_data(2, '201002', 'male', 5, town='KE')
+        self._insert_data(3, '201001', 'female', 10, town='BA')
+        self._insert_data(4, '201002', None, 3, town='KE')
+        self._insert_data(5, '201003', 'female', None, town='ZA')
+
+        select = self.mytable.select()
+        for rows, cols in [('yearmonth', ['town', 'gender']),
+                           (['yearmonth', 'gender'], 'town')]:
+            table = pivots.pivot_table_from_select(select, rows, cols,
+                                                   'price', columnar=True)
+            expected = pivots.pivot_table_from_select(select, rows, cols,
+                                                      'price')
+
+            self.assertEquals(str(expected), str(table))
+            self.assertEquals(list(expected.index), list(table.index))
+
+    def test_columnar_empty(self):
+        table = pivots.pivot_table_from_select(
+            self.mytable.select(),
+            rows='yearmonth', cols='gender', values='price', columnar=True
+        )
+
+        self.assertIsNone(table)
+
+    def test_pivot_data_chunks(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201002', 'male', 5)
+        self._insert_data(3, '201001', 'female', 10)
+
+        chunks = list(pivots.pivot_data_chunks(
+            self.mytable.select(),
+            rows='yearmonth', cols='gender', values='price', chunk_size=2
+        ))
+
+        self.assertEquals([2, 1], [len(chunk) for chunk in chunks])
+
+    def test_stream(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201001', 'male', 5)
+        self._insert_data(3, '201001', 'female', 10)
+        self._insert_data(4, '201002', 'female', 4)
+
+        table = pivots.pivot_table_streamed(
+            self.mytable.select(),
+            rows='yearmonth', cols='gender', values=('avg', 'price'),
+            chunk_size=1
+        )
+
+        self.assertEquals(10, table.price.female['201001'])
+        self.assertEquals(4, table.price.female['201002'])
+        self.assertEquals(7.5, table.price.male['201001'])
+
+    def test_stream_fold(self):
+        for i, yearmonth in enumerate(['201003', '201001', '201002']):
+            self._insert_data(i, yearmonth, 'male', i)
+
+        fold_chunks = table_module.STREAM_FOLD_CHUNKS
+        table_module.STREAM_FOLD_CHUNKS = 2
+        try:
+            table = pivots.pivot_table_streamed(
+                self.mytable.select().order_by('yearmonth'), 'gender',
+                'yearmonth', 'price', chunk_size=1)
+        finally:
+            table_module.STREAM_FOLD_CHUNKS = fold_chunks
+
+        self.assertEquals(
+            str(pivots.pivot_table_from_select(self.mytable.select(),
+                                               'gender', 'yearmonth',
+                                               'price')),
+            str(table))
+
+    def test_stream_empty(self):
+        table = pivots.pivot_table_from_select(
+            self.mytable.select(),
+            rows='yearmonth', cols='gender', values='price', stream=True
+        )
+
+        self.assertIsNone(table)
+
+    def test_pivot_col_keys(self):
+        self._insert_data(1, '201001', 'male', 10, town='KE')
+        self._insert_data(2, '201001', 'male', 5, town='BA')
+        self._insert_data(3, '201001', 'female', 10)
+
+        keys = pivots.pivot_col_keys(self.mytable.select(), ['town', 'gender'])
+
+        self.assertEquals([(u'BA', u'male'), (u'KE', u'male')], keys)
+
+    def test_sql_pivot(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201001', 'male', 5)
+        self._insert_data(3, '201001', 'female', 10)
+        self._insert_data(4, '201002', 'female', 4)
+
+        table = pivots.pivot_table_from_select(
+            self.mytable.select(),
+            rows='yearmonth', cols='gender',
+            values=[('count', 'price'), ('sum', 'price')], sql_pivot=True
+        )
+        expected = pivots.pivot_table_from_select(
+            self.mytable.select(),
+            rows='yearmonth', cols='gender',
+            values=[('count', 'price'), ('sum', 'price')]
+        )
+
+        self.assertEquals(str(expected), str(table))
+        self.assertEquals(2, table.price_count.male['201001'])
+        self.assertEquals(15, table.price_sum.male['201001'])
+        self.assertEquals(4, table.price_sum.female['201002'])
+
+    def test_sql_pivot_col_keys(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201001', 'male', 5)
+        self._insert_data(3, '201001', 'female', 10)
+
+        table = pivots.pivot_table_from_select(
+            self.mytable.select(),
+            rows='yearmonth', cols='gender', values='price',
+            col_keys=['male']
+        )
+
+        self.assertEquals([('price', 'male')], list(table.columns))
+        self.assertEquals(15, table.price.male['201001'])
+
+    def test_sql_pivot_col_keys_limit(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201001', 'female', 5)
+        self._insert_data(3, '201001', None, 3)
+
+        table = pivots.pivot_table_from_select(
+            self.mytable.select(),
+            rows='yearmonth', cols='gender', values='price',
+            col_keys=['male', 'female'], max_col_keys=1
+        )
+
+        self.assertEquals([('price', 'female'), ('price', 'male')],
+                          list(table.columns))
+
+    def test_sql_pivot_null_rows(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, None, 'male', 5)
+        self._insert_data(3, '201002', 'female', 4)
+
+        table = pivots.pivot_table_from_select(
+            self.mytable.select(),
+            rows='yearmonth', cols='gender', values='price',
+            col_keys=['male']
+        )
+
+        # pivot_table of pandas < 0.14 keeps rows without values
+        expected = [u'201001', u'201002'] if _LEGACY_PIVOT else [u'201001']
+        self.assertEquals(expected, list(table.index))
+
+    def test_sql_pivot_fallback(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201001', 'male', 5)
+        self._insert_data(3, '201001', 'female', 10)
+
+        table = pivots.pivot_table_from_select(
+            self.mytable.select(),
+            rows='yearmonth', cols='gender', values='price',
+            sql_pivot=True, max_col_keys=1
+        )
+
+        self.assertEquals(10, table.price.female['201001'])
+        self.assertEquals(15, table.price.male['201001'])
+
+    def test_pivot_many(self):
+        self._insert_data(1, '201001', 'male', 10, town='BA')
+        self._insert_data(2, '201001', 'male', 5, town='KE')
+        self._insert_data(3, '201002', 'female', 10, town='BA')
+
+        select = self.mytable.select()
+        specs = [
+            ('yearmonth', 'gender', 'price'),
+            ('yearmonth', 'town', ('count', 'price')),
+            ('yearmonth', 'gender', ('avg', 'price')),
+            ('town', [], 'price'),
+        ]
+        tables = pivots.pivot_many(select, specs)
+
+        self.assertEquals(4, len(tables))
+        for table, (rows, cols, values) in zip(tables, specs):
+            expected = pivots.pivot_table_from_select(select, rows, cols,
+                                                      values)
+            self.assertEquals(str(expected), str(table))
+
+    def test_pivot_many_empty(self):
+        tables = pivots.pivot_many(self.mytable.select(), [
+            ('yearmonth', 'gender', 'price'),
+            ('yearmonth', 'town', 'price'),
+        ])
+
+        self.assertEquals([None, None], tables)
+
+    def test_max_cols(self):
+        self._insert_data(1, '201001', 'male', 10, town='BA')
+        self._insert_data(2, '201001', 'male', 5, town='KE')
+        self._insert_data(3, '201001', 'female', 8, town='PO')
+        self._insert_data(4, '201002', 'female', 4, town='BA')
+        self._insert_data(5, '201002', 'female', 1, town='ZA')
+
+        table = pivots.pivot_table_from_select(
+            self.mytable.select(),
+            rows='yearmonth', cols='town', values='price', max_cols=2
+        )
+
+        self.assertEquals([('price', u'BA'), ('price', u'Other'),
+                           ('price', u'PO')], list(table.columns))
+        self.assertEquals(10, table.price.BA['201001'])
+        self.assertEquals(4, table.price.BA['201002'])
+        self.assertEquals(5, table.price.Other['201001'])
+        self.assertEquals(1, table.price.Other['201002'])
+
+    def test_max_cols_top_by(self):
+        self._insert_data(1, '201001', 'male', 10, town='BA')
+        self._insert_data(2, '201001', 'male', 5, town='KE')
+        self._insert_data(3, '201001', 'female', 8, town='KE')
+        self._insert_data(4, '201001', 'female', 2, town='KE')
+
+        data = pivots.pivot_data(
+            self.mytable.select().order_by('town', 'gender'),
+            rows='yearmonth', cols=['town', 'gender'], values='price',
+            max_cols=1, top_by=('count', 'price'), other='-'
+        )
+
+        self.assertEquals([(u'201001', u'-', u'-', 15),
+                           (u'201001', u'KE', u'female', 10)], sorted(data))
+
+    def test_sampled(self):
+        for i in range(1, 201):
+            self._insert_data(i, '201001', ['male', 'female'][i % 2], i % 7)
+
+        values = [('count', 'price'), 'price', ('avg', 'price')]
+        table, errors = pivots.pivot_table_sampled(
+            self.mytable.select(), 'yearmonth', 'gender', values, 0.5,
+            sample_column='customer_id')
+
+        p = 5004 / 10007.0
+        sample = [i for i in range(1, 201) if not i % 2 and
+                  (i % 10007) * 7919 % 10007 < 5004]
+        prices = [i % 7 for i in sample]
+        count = table['price_count']['male']['201001']
+        self.assertAlmostEqual(len(sample) / p, count)
+        self.assertAlmostEqual(sum(prices) / p,
+                               table['price_sum']['male']['201001'])
+        self.assertAlmostEqual(float(sum(prices)) / len(sample),
+                               table['price_avg']['male']['201001'])
+        self.assertAlmostEqual(
+            ((1 - p) * sum(a * a for a in prices)) ** 0.5 / p,
+            errors['price_sum']['male']['201001'])
+
+        approximate = pivots.pivot_table_from_select(
+            self.mytable.select(), 'yearmonth', 'gender', values,
+            approximate=0.5, sample_column='customer_id')
+        self.assertEquals(str(table), str(approximate))
+
+    def test_sampled_all(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201001', 'male', 5)
+        self._insert_data(3, '201001', 'female', 10)
+
+        table, errors = pivots.pivot_table_sampled(
+            self.mytable.select(), 'yearmonth', 'gender', 'price', 1)
+
+        self.assertEquals([[10, 15]], table.values.tolist())
+        self.assertEquals([[0, 0]], errors.values.tolist())
+
+    def test_sampled_min_max(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201001', 'male', 5)
+        self._insert_data(3, '201001', 'female', 10)
+
+        table, errors = pivots.pivot_table_sampled(
+            self.mytable.select(), 'yearmonth', 'gender',
+            [('min', 'price'), ('count', 'price')], 1)
+
+        self.assertEquals(list(table.columns), list(errors.columns))
+        self.assertEquals([[10, 5]], table['price_min'].values.tolist())
+        self.assertTrue(errors['price_min'].isnull().values.all())
+        self.assertEquals([[0, 0]], errors['price_count'].values.tolist())
+
+    def test_sampled_errors(self):
+        self.assertRaises(ValueError, pivots.pivot_table_sampled,
+                          self.mytable.select(), 'yearmonth', 'gender',
+                          'price', 0.1)
+        self.assertRaises(ValueError, pivots.pivot_table_sampled,
+                          self.mytable.select(), 'yearmonth', 'gender',
+                          ('stddev', 'price'), 0.1, 'customer_id')
+
+    def test_margins(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201001', 'male', 5)
+        self._insert_data(3, '201001', 'female', 10)
+        self._insert_data(4, '201002', 'female', 4)
+
+        table = pivots.pivot_table_from_select(
+            self.mytable.select(),
+            rows='yearmonth', cols='gender', values=('avg', 'price'),
+            margins=True
+        )
+
+        self.assertEquals([u'201001', u'201002', 'All'], list(table.index))
+        self.assertEquals([('price', u'female'), ('price', u'male'),
+                           ('price', 'All')], list(table.columns))
+        self.assertEquals(7.5, table.price.male['201001'])
+        self.assertEquals(7, table.price.female['All'])
+        self.assertEquals(7.5, table.price.male['All'])
+        self.assertEquals(4, table.price.All['201002'])
+        self.assertEquals(7.25, table.price.All['All'])
+
+    def test_margins_levels(self):
+        self._insert_data(1, '201001', 'male', 10, town='BA')
+        self._insert_data(2, '201001', 'male', 5, town='KE')
+        self._insert_data(3, '201002', 'female', 10, town='BA')
+
+        table = pivots.pivot_table_from_select(
+            self.mytable.select(),
+            rows=['yearmonth', 'town'], cols='gender', values='price',
+            margins=True
+        )
+
+        self.assertEquals(15, table.price.male['201001']['All'])
+        self.assertEquals(10, table.price.female['201002']['All'])
+        self.assertEquals(25, table.price.All['All']['All'])
+        self.assertEquals(10, table.price.male['201001']['BA'])
+
+    def test_margins_empty(self):
+        table = pivots.pivot_table_from_select(
+            self.mytable.select(),
+            rows='yearmonth', cols='gender', values='price', margins=True
+        )
+
+        self.assertIsNone(table)
+
+    def test_params(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201001', 'male', 5)
+        self._insert_data(3, '201001', 'female', 10)
+
+        select = self.mytable.select().where(
+            self.mytable.c.gender == sqlalchemy.bindparam('gender'))
+
+        male = pivots.pivot_data(select, 'yearmonth', 'gender', 'price',
+                                 params={'gender': 'male'})
+        female = pivots.pivot_data(select, 'yearmonth', 'gender', 'price',
+                                   params={'gender': 'female'})
+
+        self.assertEquals([(u'201001', u'male', 15)], male)
+        self.assertEquals([(u'201001', u'female', 10)], female)
+
+    def test_params_options(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201001', 'male', 5)
+        self._insert_data(3, '201001', 'female', 10)
+
+        select = self.mytable.select().where(
+            self.mytable.c.gender == sqlalchemy.bindparam('gender'))
+
+        for options in [{}, {'columnar': True}, {'stream': True},
+                        {'sql_pivot': True}, {'col_keys': ['male']},
+                        {'margins': True}, {'approximate': 1}]:
+            table = pivots.pivot_table_from_select(
+                select, 'yearmonth', 'gender', 'price',
+                params={'gender': 'male'}, **options)
+
+            self.assertEquals(15, table['price']['male']['201001'])
+            self.assertNotIn('female', table['price'])
+
+    def test_invalid_options(self):
+        select = self.mytable.select()
+        for options in [{'columnar': True, 'stream': True},
+                        {'margins': True, 'sql_pivot': True},
+                        {'stream': True, 'cache': pivots.MemoryCache()},
+                        {'margins': True, 'max_cols': 1}]:
+            self.assertRaises(ValueError, pivots.pivot_table_from_select,
+                              select, 'yearmonth', 'gender', 'price',
+                              **options)
+
+    def test_statement_cache(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201001', 'male', 5)
+        self._insert_data(3, '201001', 'female', 10)
+
+        select = self.mytable.select()
+        with instrument.collect() as events:
+            pivots.pivot_data(select, 'yearmonth', ['gender'], 'price')
+            pivots.pivot_data(select, 'yearmonth', ['gender'], 'price')
+
+        self.assertIs(
+            _compile_pivot_select(select, 'yearmonth', ['gender'], 'price'),
+            _compile_pivot_select(select, 'yearmonth', ['gender'], 'price'))
+        [first, second] = [e['sql'] for e in events if e['stage'] == 'compile']
+        self.assertEquals(first, second)
+
+    def test_params_cache(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201001', 'male', 5)
+        self._insert_data(3, '201001', 'female', 10)
+
+        cache = pivots.MemoryCache()
+        select = self.mytable.select().where(
+            self.mytable.c.gender == sqlalchemy.bindparam('gender'))
+
+        for gender in ['male', 'female', 'male']:
+            pivots.pivot_table_from_select(
+                select, 'yearmonth', 'gender', 'price', cache=cache,
+                params={'gender': gender})
+
+        self.assertEquals(1, cache.hits)
+        self.assertEquals(2, cache.misses)
+
+
+class PartitionedPivotTest(PivotTestCase):
+    file_database = True
+
+    def test_partitioned(self):
+        self._insert_data(1, '201001', 'male', 10, town='BA')
+        self._insert_data(2, '201001', 'male', 5, town='KE')
+        self._insert_data(3, '201002', 'female', 10, town='BA')
+        self._insert_data(4, '201003', 'female', 7)
+        self._insert_data(None, '201003', 'female', 2)
+
+        select = self.mytable.select()
+        rows = ['yearmonth', 'customer_id']
+        expected = sorted(pivots.pivot_data(select, rows, 'gender', 'price'),
+                          key=str)
+        for partition in ['customer_id',
+                          sqlalchemy.cast(select.c.customer_id,
+                                          sqlalchemy.Numeric)]:
+            data = pivots.pivot_data_partitioned(
+                select, rows=rows, cols='gender', values='price',
+                partition=partition, partitions=2
+            )
+
+            self.assertEquals(expected, sorted(data, key=str))
+
+    def test_partitioned_params(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201001', 'female', 5)
+        self._insert_data(3, '201002', 'male', 7)
+
+        select = self.mytable.select().where(
+            self.mytable.c.gender == sqlalchemy.bindparam('gender'))
+        for partition in ['customer_id',
+                          sqlalchemy.cast(select.c.customer_id,
+                                          sqlalchemy.Numeric)]:
+            data = pivots.pivot_data_partitioned(
+                select, rows='customer_id', cols='gender', values='price',
+                partition=partition, partitions=2, params={'gender': 'male'})
+
+            self.assertEquals([(1, u'male', 10), (3, u'male', 7)],
+                              sorted(data))
+
+    def test_partitioned_expression(self):
+        self._insert_data(1, '201001', 'male', 10)
+        self._insert_data(2, '201001', 'male', 5)
+        self._insert_data(3, '201001', 'female', 10)
+
+        select = self.mytable.select()
+        table = pivots.pivot_table_from_select(
+            select, rows=['yearmonth', 'customer_id'], cols='gender',
+            values='price', partition=select.c.customer_id % 2
+        )
+
+        self.assertEquals(10, table.price.male['201001'][1])
+        self.assertEquals(5, table.price.male['201001'][2])
+        self.assertEquals(10, table.price.female['201001'][3])
+
+    def test_partitioned_empty(self):
+        for partition in ['customer_id',
+                          sqlalchemy.cast(self.mytable.c.customer_id,
+                                          sqlalchemy.Numeric)]:
+            data = pivots.pivot_data_partitioned(
+                self.mytable.select(), 'customer_id', 'gender', 'price',
+                partition=partition
+            )
+
+            self.assertEquals([], data)
+
+    def test_partitioned_invalid(self):
+        select = self.mytable.select()
+        for partition in ['customer_id', select.c.customer_id % 2, 'gender']:
+            self.assertRaises(ValueError, pivots.pivot_data_partitioned,
+                              select, 'yearmonth', 'gender', 'price',
+                              partition=partition)
+
+
+class TimeBucketTest(TableTestCase):
+    columns = [
+        ('created', sqlalchemy.DateTime),
+        ('gender', sqlalchemy.String(50)),
+        ('price', sqlalchemy.Integer),
+    ]
+    data = [(datetime(2010, 1, 4, 10, 30), 'male', 10),
+            (datetime(2010, 1, 10, 23, 59), 'male', 5),
+            (datetime(2010, 2, 1, 8, 0), 'female', 10),
+            (datetime(2010, 5, 31, 8, 0), 'female', 1)]
+
+    def test_grains(self):
+        select = self.mytable.select()
+        expected = {
+            'year': [datetime(2010, 1, 1)],
+            'quarter': [datetime(2010, 1, 1), datetime(2010, 4, 1)],
+            'month': [datetime(2010, 1, 1), datetime(2010, 2, 1),
+                      datetime(2010, 5, 1)],
+            'week': [datetime(2010, 1, 4), datetime(2010, 2, 1),
+                     datetime(2010, 5, 31)],
+            'day': [datetime(2010, 1, 4), datetime(2010, 1, 10),
+                    datetime(2010, 2, 1), datetime(2010, 5, 31)],
+            'hour': [datetime(2010, 1, 4, 10), datetime(2010, 1, 10, 23),
+                     datetime(2010, 2, 1, 8), datetime(2010, 5, 31, 8)],
+        }
+
+        for grain, keys in expected.items():
+            data = pivots.pivot_data(select, TimeBucket('created', grain),
+                                     [], 'price')
+            self.assertEquals(keys, sorted(key for key, _ in data))
+
+    def test_pivot_table(self):
+        table = pivots.pivot_table_from_select(
+            self.mytable.select(), rows=TimeBucket('created', 'month'),
+            cols='gender', values='price')
+
+        self.assertTrue(isinstance(table.index, pd.DatetimeIndex))
+        self.assertEquals('created', table.index.name)
+        self.assertEquals([15, 10, 1],
+                          table.fillna(0).sum(axis=1).tolist())
+
+    def test_columnar(self):
+        rows = TimeBucket('created', 'quarter')
+        df = pivots.pivot_data_frame(self.mytable.select(), rows, 'gender',
+                                     'price')
+        table = pivots.pivot_table_from_select(
+            self.mytable.select(), rows, 'gender', 'price', columnar=True)
+
+        self.assertEquals(['created', 'gender', 'price'], list(df.columns))
+        self.assertEquals('M', df['created'].dtype.kind)
+        self.assertEquals([datetime(2010, 1, 1), datetime(2010, 4, 1)],
+                          table.index.tolist())
+
+    def test_unknown_grain(self):
+        self.assertRaises(ValueError, TimeBucket, 'created', 'decade')
+
+    def test_unsupported(self):
+        select = self.mytable.select()
+        rows = TimeBucket('created', 'month')
+
+        self.assertRaises(ValueError, pivots.pivot_many, select,
+                          [(rows, 'gender', 'price')])
+        self.assertRaises(ValueError, pivots.pivot_table_margins, select,
+                          rows, 'gender', 'price')
+
+        statement = _compile_pivot_select(select, rows, 'gender', 'price')
+        for dialect in [mysql.dialect(), mssql.dialect(), oracle.dialect()]:
+            self.assertRaises(ValueError, statement.compile, dialect=dialect)
+        self.assertIn('date_trunc',
+                      str(statement.compile(dialect=postgresql.dialect())))
+
+
+class UnstackTest(TestCase):
+    def test_unstack(self):
+        df = pd.DataFrame(
+            [(u'201002', u'KE', u'male', 5, 1),
+             (u'201001', u'BA', u'male', 10, 2),
+             (u'201001', u'BA', u'female', 10, None),
+             (u'201001', None, u'female', 3, 4),
+             (u'201003', u'BA', u'female', None, None)],
+            columns=['yearmonth', 'town', 'gender', 'price', 'count']
+        )
+
+        for rows, cols in [('yearmonth', ['town', 'gender']),
+                           (['yearmonth', 'gender'], 'town'),
+                           (['yearmonth', 'town', 'gender'], [])]:
+            expected = _pivot_frame(df, rows, cols, ['price', 'count'],
+                                    'mean')
+            table = _unstack(df, rows, cols, ['price', 'count'])
+
+            self.assertEquals(str(expected), str(table))
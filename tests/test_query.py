@@ -0,0 +1,95 @@
+import pandas as pd
+import sqlalchemy
+import pivots
+from pivots import instrument
+from base import TableTestCase
+
+
+class PivotQueryTest(TableTestCase):
+    columns = [
+        ('yearmonth', sqlalchemy.String(50)),
+        ('gender', sqlalchemy.String(50)),
+        ('town', sqlalchemy.String(50)),
+        ('price', sqlalchemy.Integer),
+    ]
+    data = [('201001', 'male', 'BA', 10), ('201001', 'male', 'KE', 5),
+            ('201001', 'female', 'BA', 10), ('201002', 'female', 'KE', 4),
+            ('201002', 'female', 'KE', 2)]
+
+    def setUp(self):
+        super(PivotQueryTest, self).setUp()
+        self.query = pivots.PivotQuery(
+            self.mytable.select(), rows=['yearmonth', 'town'], cols='gender',
+            values=['price', ('avg', 'price')])
+
+    def _executed(self, query):
+        with instrument.collect() as events:
+            table = query.table()
+        return table, len([e for e in events if e['stage'] == 'execute'])
+
+    def _expected(self, rows, cols, values, select=None):
+        return pivots.pivot_table_from_select(
+            select if select is not None else self.mytable.select(),
+            rows, cols, values)
+
+    def test_table(self):
+        table, executed = self._executed(self.query)
+
+        self.assertEquals(1, executed)
+        self.assertEquals(
+            str(self._expected(['yearmonth', 'town'], 'gender',
+                               ['price', ('avg', 'price')])),
+            str(table))
+
+    def test_drill_up(self):
+        self.query.table()
+        table, executed = self._executed(self.query.with_rows('yearmonth'))
+
+        self.assertEquals(0, executed)
+        self.assertEquals(
+            str(self._expected('yearmonth', 'gender',
+                               ['price', ('avg', 'price')])),
+            str(table))
+
+    def test_filter(self):
+        self.query.table()
+        query = self.query.with_rows('yearmonth').filter('town', 'KE')
+        table, executed = self._executed(query)
+
+        self.assertEquals(0, executed)
+        self.assertEquals(5, table['price_sum']['male']['201001'])
+        self.assertEquals(6, table['price_sum']['female']['201002'])
+        self.assertEquals(3, table['price_avg']['female']['201002'])
+
+    def test_filter_other_column(self):
+        query = self.query.with_rows('yearmonth').filter('gender', 'male')
+        query.table()
+        table, executed = self._executed(query.filter('town', 'BA'))
+
+        self.assertEquals(1, executed)
+        self.assertEquals(10, table['price_sum']['male']['201001'])
+
+    def test_not_reaggregable(self):
+        self.query.table()
+        query = self.query.with_rows('yearmonth').with_values(
+            [('min', 'price'), ('total', 'price')])
+        table, executed = self._executed(query)
+
+        self.assertEquals(1, executed)
+        self.assertEquals(
+            str(self._expected('yearmonth', 'gender',
+                               [('min', 'price'), ('total', 'price')])),
+            str(table))
+
+    def test_drill_up_null_sum(self):
+        self._insert_data('201003', 'male', 'BA', None)
+        self._insert_data('201003', 'male', 'KE', None)
+        self._insert_data('201003', 'female', 'KE', 3)
+        query = self.query.with_values('price')
+        query.table()
+        table, executed = self._executed(query.with_rows('yearmonth'))
+
+        self.assertEquals(0, executed)
+        self.assertTrue(pd.isnull(table['price']['male']['201003']))
+        self.assertEquals(str(self._expected('yearmonth', 'gender', 'price')),
+                          str(table))
@@ -0,0 +1,63 @@
+from unittest import skipIf
+import sqlalchemy
+import pivots
+from base import TableTestCase
+
+try:
+    from pivots import sparse
+except ImportError:
+    sparse = None
+
+
+@skipIf(sparse is None, 'requires scipy and pandas 0.25')
+class SparsePivotTest(TableTestCase):
+    columns = [
+        ('customer_id', sqlalchemy.Integer),
+        ('product', sqlalchemy.String(50)),
+        ('price', sqlalchemy.Numeric),
+    ]
+    data = [(1, 'a', 10), (1, 'a', 5), (2, 'b', 3), (3, 'c', 0), (4, 'a', 1)]
+
+    def _dense(self, values):
+        return pivots.pivot_table_from_select(
+            self.mytable.select(), 'customer_id', 'product', values)
+
+    def test_pivot_table_sparse(self):
+        values = ['price', ('count', 'price')]
+        table = pivots.pivot_table_from_select(
+            self.mytable.select(), 'customer_id', 'product', values,
+            sparse=True)
+        dense = self._dense(values)
+
+        self.assertTrue(all(str(dtype).startswith('Sparse')
+                            for dtype in table.dtypes))
+        self.assertEquals(list(dense.index), list(table.index))
+        self.assertEquals(list(dense.columns), list(table.columns))
+        self.assertTrue(
+            dense.equals(table.sparse.to_dense().astype(dense.dtypes)))
+
+    def test_pivot_matrix(self):
+        df = pivots.pivot_data_frame(self.mytable.select(), 'customer_id',
+                                     'product', 'price')
+        matrix, index, columns = sparse.pivot_matrix(
+            df, 'customer_id', 'product', ['price'])
+
+        self.assertEquals((4, 3), matrix.shape)
+        self.assertEquals(4, matrix.nnz)
+        self.assertEquals([1, 2, 3, 4], list(index))
+        self.assertEquals([('price', 'a'), ('price', 'b'), ('price', 'c')],
+                          list(columns))
+
+    def test_empty(self):
+        self.mytable.delete().execute()
+        self.assertEquals(None, sparse.pivot_table_sparse(
+            self.mytable.select(), 'customer_id', 'product', 'price'))
+
+    def test_chart(self):
+        table = sparse.pivot_table_sparse(self.mytable.select(),
+                                          'customer_id', 'product', 'price')
+        dense = self._dense('price')
+
+        self.assertEquals(
+            pivots.get_chart(dense, 'customer_id', 'product', 'price', {}),
+            pivots.get_chart(table, 'customer_id', 'product', 'price', {}))
@@ -0,0 +1,118 @@
+import json
+import os
+import shutil
+import tempfile
+import pivots
+from pivots import instrument
+from pivots.store import pivot_key
+from base import TableTestCase
+
+
+class SharedStoreTest(TableTestCase):
+    data = [('201001', 'male', 10), ('201001', 'male', 5),
+            ('201002', 'female', 10)]
+
+    def setUp(self):
+        super(SharedStoreTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.store = pivots.SharedStore(self.directory)
+        self.select = self.mytable.select()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(SharedStoreTest, self).tearDown()
+
+    def _pivot_table(self, store):
+        with instrument.collect() as events:
+            table = store.pivot_table(self.select, 'yearmonth', 'gender',
+                                      'price')
+        return table, len([e for e in events if e['stage'] == 'execute'])
+
+    def test_pivot_table(self):
+        expected, executed = self._pivot_table(self.store)
+        self.assertEquals(1, executed)
+
+        other = pivots.SharedStore(self.directory)
+        table, executed = self._pivot_table(other)
+
+        self.assertEquals(0, executed)
+        self.assertEquals(str(expected), str(table))
+        self.assertFalse(table.values.flags.writeable)
+        self.assertEquals({'hits': 1, 'misses': 0, 'evictions': 0, 'size': 1},
+                          other.stats())
+
+    def test_key(self):
+        key = pivot_key(self.select, 'yearmonth', 'gender', 'price')
+
+        self.assertEquals(key, pivot_key(self.select, 'yearmonth', 'gender',
+                                         'price', cache=pivots.MemoryCache()))
+        self.assertNotEqual(key, pivot_key(self.select, 'yearmonth',
+                                           'gender', 'price', margins=True))
+        self.assertNotEqual(key, pivot_key(self.select, 'gender',
+                                           'yearmonth', 'price'))
+
+    def test_chart(self):
+        key = pivot_key(self.select, 'yearmonth', 'gender', 'price')
+        table = self.store.pivot_table(self.select, 'yearmonth', 'gender',
+                                       'price')
+        self.assertEquals(None, self.store.get_chart(key))
+
+        chart = self.store.set_chart(key, table, 'yearmonth', 'gender',
+                                     'price', {})
+
+        self.assertEquals(chart, pivots.SharedStore(self.directory).get_chart(
+            key))
+        self.assertEquals(
+            json.loads(json.dumps(pivots.get_chart(
+                table, 'yearmonth', 'gender', 'price', {}))),
+            json.loads(chart))
+
+    def test_ttl(self):
+        self._pivot_table(self.store)
+        expired = pivots.SharedStore(self.directory, ttl=-1)
+
+        self.assertEquals(1, expired.cleanup())
+        self.assertEquals(0, len(self.store))
+
+    def test_invalidate(self):
+        self._pivot_table(self.store)
+
+        self.store.invalidate(tables=['other'])
+        self.assertEquals(1, len(self.store))
+
+        self.store.invalidate(tables=['mytable'])
+        self.assertEquals(0, len(self.store))
+        self.assertEquals(1, self._pivot_table(self.store)[1])
+
+    def test_object_values(self):
+        table = self.store.pivot_table(self.select, 'yearmonth', 'gender',
+                                       'price')
+        self.assertRaises(ValueError, self.store.set, 'key',
+                          table.astype(object))
+        self.assertRaises(ValueError, self.store.set, 'key',
+                          table.iloc[:, 0])
+
+    def test_options(self):
+        for options in [{'sparse': True}, {'approximate': 0.5}]:
+            self.assertRaises(ValueError, self.store.pivot_table, self.select,
+                              'yearmonth', 'gender', 'price', **options)
+        self.assertEquals(0, len(self.store))
+
+    def test_directory(self):
+        os.chmod(self.directory, 0o755)
+        self.assertRaises(ValueError, pivots.SharedStore, self.directory)
+
+        directory = os.path.join(self.directory, 'pivots')
+        pivots.SharedStore(directory)
+        self.assertEquals(0o700, os.stat(directory).st_mode & 0o777)
+
+    def test_truncated(self):
+        self._pivot_table(self.store)
+        key = pivot_key(self.select, 'yearmonth', 'gender', 'price')
+        path = self.store._path(key)
+        with open(path, 'rb') as f:
+            data = f.read()
+        with open(path, 'wb') as f:
+            f.write(data[:-8])
+
+        self.assertEquals(None, self.store.get(key))